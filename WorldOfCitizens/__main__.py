@@ -0,0 +1,4 @@
+from WorldOfCitizens.simulation import main
+
+
+main()
@@ -0,0 +1,32 @@
+import numpy as np
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.population import initialize_population
+from WorldOfCitizens.simulation import Simulation
+from WorldOfCitizens.stat_tracker import StatTracker
+
+
+class BatchSimulation(Simulation):
+    """
+    Simulates replicates of the same world in lockstep.
+
+    The population has the shape (replicates, citizens, keys), every step processes all
+    replicates with the same vectorized operations. Stat curves hold one count per replicate
+    and tick, use curves() to get them per replicate.
+    """
+
+    def __init__(self, config: Config, replicates: int, seed=None, stat_tracker: StatTracker = None):
+        self._replicates = replicates
+        super().__init__(config, seed=seed, stat_tracker=stat_tracker)
+
+    def _initialize_population(self):
+        return initialize_population(self._config, self._rng, replicates=self._replicates)
+
+    @property
+    def replicates(self) -> int:
+        return self._population.shape[0]
+
+    def curves(self, name: str) -> np.ndarray:
+        """
+        Stat curve with the shape (replicates, ticks)
+        """
+        return getattr(self._stat_tracker, name).T
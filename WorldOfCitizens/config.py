@@ -1,111 +1,188 @@
 import os
 import configparser
+import numpy as np
 from WorldOfCitizens.log import root_logger
 
 
 logger = root_logger.getChild('config')
 
-
-class Config(object):
-    def __init__(self, filename=None):
-        self._configparser = configparser.ConfigParser(
-            defaults={
-
-            }
-        )
-        if filename is not None and os.path.isfile(filename):
-            logger.info('Loading configuration from {}'.format(filename))
-            self._configparser.read(filename)
-
+# Typed values: attribute, section, option, type, default
+_SCHEMA = [
     # Population/Simulation
-    # ---------------------
-
-    @property
-    def popuplation_size(self) -> int:
-        return self._configparser.getint('simulation', 'populationSize')
-
-    @property
-    def init_avg_speed(self) -> float:
-        return self._configparser.getfloat('simulation', 'initAvgSpeed')
-
-    @property
-    def log_level(self) -> str:
-        return self._configparser.get('simulation', 'logLevel')
+    ('popuplation_size', 'simulation', 'populationSize', int, 100),
+    ('init_avg_speed', 'simulation', 'initAvgSpeed', float, 0.08),
+    ('log_level', 'simulation', 'logLevel', str, 'INFO'),
+    ('backend', 'simulation', 'backend', str, 'numpy'),
 
     # Movement
-    # --------
-
-    @property
-    def heading_update_probability(self) -> float:
-        return self._configparser.getfloat('movement', 'headingUpdateProbability')
-
-    @property
-    def heading_multiplicator(self) -> float:
-        return self._configparser.getfloat('movement', 'headingMultiplicator')
-
-    @property
-    def speed_multiplicator(self) -> float:
-        return self._configparser.getfloat('movement', 'speedMultiplicator')
+    ('heading_update_probability', 'movement', 'headingUpdateProbability', float, 0.02),
+    ('heading_multiplicator', 'movement', 'headingMultiplicator', float, 1.0),
+    ('speed_multiplicator', 'movement', 'speedMultiplicator', float, 1.0),
 
     # Infection
-    # ---------
-
-    @property
-    def infection_range(self) -> float:
-        return self._configparser.getfloat('infection', 'infectionRange')
-
-    @property
-    def infection_probability(self) -> float:
-        return self._configparser.getfloat('infection', 'infectionPropability')
-
-    @property
-    def recovery_duration(self):
-        rec_from = self._configparser.getint('infection', 'recoveryDurationFrom')
-        rec_to = self._configparser.getint('infection', 'recoveryDurationTo')
-        return (rec_from, rec_to)
+    ('infection_range', 'infection', 'infectionRange', float, 0.02),
+    ('infection_probability', 'infection', 'infectionPropability', float, 0.03),
+    ('recovery_duration_from', 'infection', 'recoveryDurationFrom', int, 20),
+    ('recovery_duration_to', 'infection', 'recoveryDurationTo', int, 40),
+    ('mortality_chance', 'infection', 'mortalityChance', float, 0.2),
+    ('contact_model', 'infection', 'contactModel', str, 'proximity'),
+
+    # Contact network
+    ('household_size', 'network', 'householdSize', float, 3.0),
+    ('workplace_size', 'network', 'workplaceSize', float, 10.0),
+    ('household_weight', 'network', 'householdWeight', float, 1.0),
+    ('workplace_weight', 'network', 'workplaceWeight', float, 0.2),
+    ('destination_contacts', 'network', 'destinationContacts', float, 1.0),
 
     # World
-    # -----
-
-    @property
-    def world_x_bounds(self):
-        xbounds = [
-            int(self._configparser.get('world', 'xMin')),
-            int(self._configparser.get('world', 'xMax'))
-        ]
-        return xbounds
-
-    @property
-    def world_y_bounds(self):
-        ybounds = [
-            int(self._configparser.get('world', 'yMin')),
-            int(self._configparser.get('world', 'yMax'))
-        ]
-        return ybounds
+    ('world_x_min', 'world', 'xMin', int, 0),
+    ('world_x_max', 'world', 'xMax', int, 1),
+    ('world_y_min', 'world', 'yMin', int, 0),
+    ('world_y_max', 'world', 'yMax', int, 1),
 
     # Visualization
-    # -------------
+    ('map_padding', 'visualize', 'padding', float, 0.05),
+    ('map_mode', 'visualize', 'mapMode', str, 'auto'),
+    ('density_threshold', 'visualize', 'densityThreshold', int, 50000),
+    ('density_resolution', 'visualize', 'densityResolution', int, 200),
+    ('color_healthy', 'visualize', 'colorHealthy', str, 'green'),
+    ('color_sick', 'visualize', 'colorSick', str, 'red'),
+    ('color_dead', 'visualize', 'colorDead', str, 'black'),
+    ('draw_active_destinations', 'visualize', 'drawActiveDestinations', bool, True),
+    ('color_active_destinations', 'visualize', 'colorActiveDestinations', str, 'steelblue'),
+]
+
+# Values combined from several options
+_DERIVED = ['recovery_duration', 'world_x_bounds', 'world_y_bounds']
+
+_GETTERS = {
+    int: configparser.ConfigParser.getint,
+    float: configparser.ConfigParser.getfloat,
+    bool: configparser.ConfigParser.getboolean,
+    str: configparser.ConfigParser.get
+}
 
-    @property
-    def map_padding(self) -> float:
-        return float(self._configparser.get('visualize', 'padding'))
 
-    @property
-    def color_healthy(self) -> str:
-        return self._configparser.get('visualize', 'colorHealthy')
-
-    @property
-    def color_sick(self) -> str:
-        return self._configparser.get('visualize', 'colorSick')
+class Config(object):
+    """
+    Configuration of a simulation, resolved once into typed, validated and immutable values.
 
-    @property
-    def color_dead(self) -> str:
-        return self._configparser.get('visualize', 'colorDead')
+    Values come from the INI file, then overrides ({'section.option': value}), then the defaults.
+    Reading a value is a plain attribute access, so the tick loop never parses. A Config is cheap
+    to pickle; override() returns a modified copy, to_dict() the options for Config(overrides=...).
+    """
 
-    @property
-    def draw_active_destinations(self) -> bool:
-        return self._configparser.getboolean('visualize', 'drawActiveDestinations')
+    __slots__ = [attribute for attribute, _, _, _, _ in _SCHEMA] + _DERIVED + ['_options']
 
-    @property
-    def color_active_destinations(self) -> str:
-        return self._configparser.get('visualize', 'colorActiveDestinations')
+    def __init__(self, filename=None, overrides: dict = None):
+        parser = configparser.ConfigParser()
+        if filename is not None and os.path.isfile(filename):
+            logger.info('Loading configuration from {}'.format(filename))
+            parser.read(filename)
+        if overrides is not None:
+            _set_options(parser, overrides)
+
+        for attribute, section, option, value_type, default in _SCHEMA:
+            try:
+                value = _GETTERS[value_type](parser, section, option, fallback=default)
+            except ValueError:
+                raise ValueError('Invalid value {}.{} = {}'.format(section, option, parser.get(section, option)))
+            object.__setattr__(self, attribute, value)
+        object.__setattr__(self, '_options', tuple(
+            ('{}.{}'.format(section, option), value)
+            for section in parser.sections()
+            for option, value in parser.items(section)
+        ))
+        self._resolve()
+
+    def _resolve(self):
+        object.__setattr__(self, 'recovery_duration', (self.recovery_duration_from, self.recovery_duration_to))
+        object.__setattr__(self, 'world_x_bounds', (self.world_x_min, self.world_x_max))
+        object.__setattr__(self, 'world_y_bounds', (self.world_y_min, self.world_y_max))
+        _validate(self)
+
+    def override(self, overrides: dict):
+        """
+        Copy with overwritten values, keys are given as 'section.option', e.g. 'infection.infectionRange'
+        """
+        options = self.to_dict()
+        options.update(overrides)
+        return Config(overrides=options)
+
+    def to_dict(self) -> dict:
+        """
+        All options as {'section.option': value}, Config(overrides=config.to_dict()) restores the configuration
+        """
+        return dict(self._options)
+
+    def options(self, section: str) -> dict:
+        """
+        Raw options of a section, {option: value}
+        """
+        prefix = section.lower() + '.'
+        return {key[len(prefix):]: value for key, value in self._options if key.lower().startswith(prefix)}
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Config is immutable, use override()')
+
+    def __delattr__(self, name):
+        raise AttributeError('Config is immutable')
+
+    def __eq__(self, other):
+        return isinstance(other, Config) and _values(self) == _values(other) and self._options == other._options
+
+    def __hash__(self):
+        return hash(_values(self))
+
+    def __repr__(self):
+        return 'Config({})'.format(', '.join('{}={!r}'.format(attribute, getattr(self, attribute)) for attribute, _, _, _, _ in _SCHEMA))
+
+    def __reduce__(self):
+        return _restore, (_values(self), self._options)
+
+
+def _set_options(parser, options: dict):
+    for key, value in options.items():
+        section, option = key.split('.', 1)
+        if not parser.has_section(section):
+            parser.add_section(section)
+        parser.set(section, option, str(value))
+
+
+def _values(config: Config) -> tuple:
+    return tuple(getattr(config, attribute) for attribute, _, _, _, _ in _SCHEMA)
+
+
+def _restore(values: tuple, options: tuple) -> Config:
+    config = Config.__new__(Config)
+    for (attribute, _, _, _, _), value in zip(_SCHEMA, values):
+        object.__setattr__(config, attribute, value)
+    object.__setattr__(config, '_options', options)
+    config._resolve()
+    return config
+
+
+def _validate(config: Config):
+    def check(condition, message):
+        if not condition:
+            raise ValueError('Invalid configuration: {}'.format(message))
+
+    check(config.popuplation_size >= 0, 'populationSize must not be negative')
+    check(config.init_avg_speed >= 0, 'initAvgSpeed must not be negative')
+    check(config.backend in ('numpy', 'numba'), 'backend must be numpy or numba')
+    for name, probability in (
+            ('headingUpdateProbability', config.heading_update_probability),
+            ('infectionPropability', config.infection_probability),
+            ('mortalityChance', config.mortality_chance)):
+        check(0 <= probability <= 1, '{} must be within 0...1'.format(name))
+    check(config.infection_range > 0, 'infectionRange must be positive')
+    check(0 <= config.recovery_duration_from <= config.recovery_duration_to, 'recoveryDurationFrom must be within 0...recoveryDurationTo')
+    # Durations are stored in the int16 RECOVERY_DURATION column
+    check(config.recovery_duration_to <= np.iinfo(np.int16).max, 'recoveryDurationTo must be at most {}'.format(np.iinfo(np.int16).max))
+    check(config.contact_model in ('proximity', 'network', 'both'), 'contactModel must be proximity, network or both')
+    check(config.household_size >= 1 and config.workplace_size >= 1, 'householdSize and workplaceSize must be at least 1')
+    check(min(config.household_weight, config.workplace_weight, config.destination_contacts) >= 0, 'network weights must not be negative')
+    check(config.world_x_min < config.world_x_max, 'xMin must be less than xMax')
+    check(config.world_y_min < config.world_y_max, 'yMin must be less than yMax')
+    check(config.map_mode in ('scatter', 'density', 'auto'), 'mapMode must be scatter, density or auto')
+    check(config.density_resolution > 0, 'densityResolution must be positive')
@@ -0,0 +1,101 @@
+import numpy as np
+from WorldOfCitizens import kernels
+
+
+# Offsets of the 3x3 neighbourhood of a grid cell
+_NEIGHBOUR_CELLS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+
+def find_contacts(sources_x, sources_y, targets_x, targets_y, contact_range: float, source_groups=None, target_groups=None, backend: str = kernels.BACKEND_NUMPY):
+    """
+    Find all (source, target) pairs within contact_range using a uniform grid.
+
+    The zone is the same square as in the brute force search: |dx| < range and |dy| < range.
+    Optional integer groups (e.g. the replicate of a batched simulation) restrict contacts to
+    sources and targets of the same group. backend selects the kernels (numpy or numba).
+    Returns two index arrays (into sources and targets), ordered by source, then target.
+    """
+    if len(sources_x) == 0 or len(targets_x) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    # Grid origin one cell below the smallest coordinate, so that neighbour cells never become negative
+    origin_x = min(sources_x.min(), targets_x.min()) - contact_range
+    origin_y = min(sources_y.min(), targets_y.min()) - contact_range
+
+    # Cells are a bit larger than the range, so rounding (also of float32 positions) never pushes a contact two cells away
+    cell_size = contact_range * 1.001
+    target_cx, target_cy = _cell_coordinates(targets_x, targets_y, origin_x, origin_y, cell_size)
+    source_cx, source_cy = _cell_coordinates(sources_x, sources_y, origin_x, origin_y, cell_size)
+    rows = max(target_cy.max(), source_cy.max()) + 2
+    if source_groups is not None:
+        # Every group gets its own block of columns, neighbour lookups never cross groups
+        columns = max(target_cx.max(), source_cx.max()) + 2
+        target_cx = target_cx + target_groups * columns
+        source_cx = source_cx + source_groups * columns
+
+    # Bucket targets by cell
+    target_keys = target_cx * rows + target_cy
+    target_order = np.argsort(target_keys, kind='stable')
+    sorted_keys = target_keys[target_order]
+
+    if kernels.jit_enabled(backend):
+        return kernels.expand_contacts(
+            sources_x, sources_y, source_cx, source_cy,
+            targets_x, targets_y, sorted_keys, target_order, rows, contact_range
+        )
+
+    # Look up the target range of every neighbouring cell of every source
+    starts = []
+    counts = []
+    for dx, dy in _NEIGHBOUR_CELLS:
+        keys = (source_cx + dx) * rows + (source_cy + dy)
+        start = np.searchsorted(sorted_keys, keys, side='left')
+        end = np.searchsorted(sorted_keys, keys, side='right')
+        starts.append(start)
+        counts.append(end - start)
+    starts = np.concatenate(starts)
+    counts = np.concatenate(counts)
+    source_ids = np.tile(np.arange(len(sources_x)), len(_NEIGHBOUR_CELLS))
+
+    # Expand the ranges into candidate pairs
+    total = counts.sum()
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    sources = np.repeat(source_ids, counts)
+    targets = target_order[np.repeat(starts, counts) + offsets]
+
+    # Exact zone check
+    in_zone = _in_zone(sources_x[sources], sources_y[sources], targets_x[targets], targets_y[targets], contact_range)
+    sources = sources[in_zone]
+    targets = targets[in_zone]
+
+    order = np.lexsort((targets, sources))
+    return sources[order], targets[order]
+
+
+def density_grid(x, y, labels, n_labels: int, x_bounds, y_bounds, resolution: int) -> np.ndarray:
+    """
+    Number of citizens per label (e.g. state) and cell of a grid of square cells over the bounds,
+    resolution cells along the longer side. Shape (n_labels, rows, columns), rows along y.
+    Citizens outside the bounds are not counted.
+    """
+    cell_size = max(x_bounds[1] - x_bounds[0], y_bounds[1] - y_bounds[0]) / resolution
+    columns = max(1, int(np.ceil((x_bounds[1] - x_bounds[0]) / cell_size)))
+    rows = max(1, int(np.ceil((y_bounds[1] - y_bounds[0]) / cell_size)))
+
+    cx, cy = _cell_coordinates(x, y, x_bounds[0], y_bounds[0], cell_size)
+    inside = (cx >= 0) & (cx < columns) & (cy >= 0) & (cy < rows)
+    keys = (labels[inside].astype(np.int64) * rows + cy[inside]) * columns + cx[inside]
+    return np.bincount(keys, minlength=n_labels * rows * columns).reshape(n_labels, rows, columns)
+
+
+def _cell_coordinates(x, y, origin_x, origin_y, cell_size):
+    cx = np.floor((x - origin_x) / cell_size).astype(np.int64)
+    cy = np.floor((y - origin_y) / cell_size).astype(np.int64)
+    return cx, cy
+
+
+def _in_zone(source_x, source_y, target_x, target_y, contact_range):
+    return (target_x > source_x - contact_range) & \
+        (target_y > source_y - contact_range) & \
+        (target_x < source_x + contact_range) & \
+        (target_y < source_y + contact_range)
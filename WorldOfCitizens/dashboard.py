@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import socket
+import asyncio
+import argparse
+import threading
+import numpy as np
+
+_here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_here, '..')))
+from WorldOfCitizens.log import root_logger
+from WorldOfCitizens.population import X, Y, STATE
+from WorldOfCitizens.stat_tracker import COLUMNS
+
+
+logger = root_logger.getChild('dashboard')
+
+# Seconds close() waits for clients to receive their last messages
+SHUTDOWN_TIMEOUT = 5.0
+
+
+class DashboardServer(object):
+    """
+    Simulation observer, publishes the stats of every every-th tick and a downsampled snapshot of
+    every snapshot_every-th tick as JSON lines to all connected clients of a TCP (or Unix) socket.
+
+    The server runs an asyncio loop in a background thread. The tick loop only hands messages over,
+    every client has its own queue of queue_size messages and loses the oldest ones when it falls
+    behind, so a slow client never blocks the simulation.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, path: str = None, every: int = 1,
+                 snapshot_every: int = 10, snapshot_size: int = 1000, queue_size: int = 16):
+        self._host = host
+        self._port = port
+        self._path = path
+        self._every = every
+        self._snapshot_every = snapshot_every
+        self._snapshot_size = snapshot_size
+        self._queue_size = queue_size
+
+        self._loop = None
+        self._server = None
+        self._clients = {}
+        self._handlers = set()
+        self._address = None
+        self._dropped = 0
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name='DashboardServer', daemon=True)
+
+    @property
+    def address(self):
+        """
+        (host, port) or the Unix socket path the server listens on
+        """
+        return self._address
+
+    @property
+    def dropped(self) -> int:
+        """
+        Messages dropped for slow clients
+        """
+        return self._dropped
+
+    def start(self):
+        """
+        Start serving, returns when the socket is bound
+        """
+        self._thread.start()
+        self._started.wait()
+        logger.info('Dashboard listening on {}'.format(self._address))
+        return self
+
+    def close(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def __call__(self, simulation):
+        frame = simulation.frame
+        if frame % self._every != 0 or self._loop is None:
+            return
+        message = {'frame': frame, 'stats': _stats(simulation.stat_tracker)}
+        if frame % self._snapshot_every == 0:
+            message['snapshot'] = _downsample(simulation.population, self._snapshot_size)
+        self._loop.call_soon_threadsafe(self._publish, message)
+
+    def _serve(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        if self._path is not None:
+            self._server = self._loop.run_until_complete(asyncio.start_unix_server(self._handle_client, path=self._path))
+            self._address = self._path
+        else:
+            self._server = self._loop.run_until_complete(asyncio.start_server(self._handle_client, self._host, self._port))
+            self._address = self._server.sockets[0].getsockname()[:2]
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _shutdown(self):
+        # Handlers exit on None. wait_closed() waits for all connections (Python >= 3.12.1),
+        # so it is awaited only after the handlers have finished.
+        self._server.close()
+        for messages in list(self._clients):
+            if messages.full():
+                messages.get_nowait()
+            messages.put_nowait(None)
+        if self._handlers:
+            await asyncio.wait(list(self._handlers), timeout=SHUTDOWN_TIMEOUT)
+        if self._handlers:
+            # Clients which do not read block in drain(), drop their connections
+            for writer in list(self._clients.values()):
+                writer.transport.abort()
+            await asyncio.wait(list(self._handlers))
+        await self._server.wait_closed()
+
+    async def _handle_client(self, reader, writer):
+        messages = asyncio.Queue(self._queue_size)
+        handler = asyncio.current_task()
+        self._clients[messages] = writer
+        self._handlers.add(handler)
+        try:
+            while True:
+                message = await messages.get()
+                if message is None:
+                    break
+                writer.write(message)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.pop(messages, None)
+            self._handlers.discard(handler)
+            writer.close()
+
+    def _publish(self, message):
+        line = (json.dumps(message) + '\n').encode()
+        for messages in self._clients:
+            if messages.full():
+                # Drop the oldest message, the client gets the latest state when it catches up
+                messages.get_nowait()
+                self._dropped += 1
+            messages.put_nowait(line)
+
+
+class DashboardClient(object):
+    """
+    Iterates the messages of a DashboardServer, address is (host, port) or a Unix socket path
+    """
+
+    def __init__(self, address, timeout: float = None):
+        if isinstance(address, str):
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(address)
+        else:
+            self._socket = socket.create_connection(tuple(address))
+        self._socket.settimeout(timeout)
+        self._file = self._socket.makefile('r')
+
+    def __iter__(self):
+        for line in self._file:
+            yield json.loads(line)
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+
+def _stats(stat_tracker) -> dict:
+    history = stat_tracker.history
+    if len(history) == 0:
+        return {}
+    record = history[-1]
+    stats = {name: record[..., column].tolist() for column, name in enumerate(COLUMNS)}
+    stats['peak_infectious'] = np.asarray(stat_tracker.peak_infectious).tolist()
+    stats['time_to_peak'] = np.asarray(stat_tracker.time_to_peak).tolist()
+    return stats
+
+
+def _downsample(population, size) -> dict:
+    """
+    Every n-th citizen of the first replicate, at most size of them
+    """
+    x = population[..., X].reshape(-1, population.shape[-2])[0]
+    y = population[..., Y].reshape(-1, population.shape[-2])[0]
+    state = population[..., STATE].reshape(-1, population.shape[-2])[0]
+    step = max(1, len(x) // size)
+    return {
+        'x': np.round(x[::step][:size], 4).tolist(),
+        'y': np.round(y[::step][:size], 4).tolist(),
+        'state': state[::step][:size].tolist()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Print the stats published by a running simulation')
+    parser.add_argument('address', help='host:port or path of a Unix socket')
+    args = parser.parse_args(argv)
+
+    address = args.address
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        address = (host, int(port))
+    client = DashboardClient(address)
+    try:
+        for message in client:
+            stats = message['stats']
+            print('frame={} {}'.format(message['frame'], ' '.join('{}={}'.format(name, stats.get(name)) for name in COLUMNS)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,9 @@
 from enum import Enum, unique
 import numpy as np
 from WorldOfCitizens.config import Config
-from WorldOfCitizens.population import DESTINATION, DESTINATION_ARRIVED, X, Y, HEADING_X, HEADING_Y, SPEED
-from WorldOfCitizens.movement import update_out_of_bounds
+from WorldOfCitizens.population import Population, DESTINATION, DESTINATION_ARRIVED, X, Y, HEADING_X, HEADING_Y
+from WorldOfCitizens.movement import ScratchBuffers, update_out_of_bounds
+from WorldOfCitizens.kernels import BACKEND_NUMPY
 
 
 @unique
@@ -14,7 +15,7 @@ class Destination(Enum):
 
 
 def initialize_destinations(config: Config):
-    destinations = np.zeros((3, 4))
+    destinations = np.zeros((3, 4), dtype=np.float32)
 
     # Center
     destinations[0][Destination.X.value] = (config.world_x_bounds[1] - config.world_x_bounds[0]) / 2
@@ -37,67 +38,82 @@ def initialize_destinations(config: Config):
     return destinations
 
 
-def go_to_location(patient, destination_index):
+def create_destinations(x, y, wander_range_x, wander_range_y):
     """
-    Sends patient to destination
+    Destination table from arrays (or scalars) of coordinates and wander ranges, e.g. for thousands of shops
     """
-    patient[DESTINATION] = destination_index
-    patient[DESTINATION_ARRIVED] = 0
-
-
-def update_heading_to_destination(population, destinations):
-    active_destinations = np.unique(population[:, DESTINATION][population[:, DESTINATION] != 0])
-    for destination_index in active_destinations:
-        destination_index = int(destination_index) - 1
-        x = destinations[destination_index, Destination.X.value]
-        y = destinations[destination_index, Destination.Y.value]
-
-        citizen_index = (population[:, DESTINATION] == (destination_index + 1)) & (population[:, DESTINATION_ARRIVED] == 0)
-        population[:, HEADING_X][citizen_index] = x - population[:, X][citizen_index]
-        population[:, HEADING_Y][citizen_index] = y - population[:, Y][citizen_index]
-
-    return population
+    x, y, wander_range_x, wander_range_y = np.broadcast_arrays(x, y, wander_range_x, wander_range_y)
+    destinations = np.zeros((len(x), 4), dtype=np.float32)
+    destinations[:, Destination.X.value] = x
+    destinations[:, Destination.Y.value] = y
+    destinations[:, Destination.WANDER_RANGE_X.value] = wander_range_x
+    destinations[:, Destination.WANDER_RANGE_Y.value] = wander_range_y
+    return destinations
 
 
-def update_at_destination(population, destinations):
+def go_to_location(population: Population, citizens, destination_index):
     """
-    Check if citizen arrived at destination
+    Sends citizens to destination
     """
-    active_destinations = np.unique(population[:, DESTINATION][population[:, DESTINATION] != 0])
-    for destination_index in active_destinations:
-        destination_index = int(destination_index) - 1
-        x = destinations[destination_index, Destination.X.value]
-        y = destinations[destination_index, Destination.Y.value]
-        range_x = destinations[destination_index, Destination.WANDER_RANGE_X.value] / 2
-        range_y = destinations[destination_index, Destination.WANDER_RANGE_Y.value] / 2
-
-        arrivals_index = (population[:, DESTINATION_ARRIVED] == 0) & \
-            (population[:, DESTINATION] == destination_index + 1) & \
-            (population[:, X] >= x - range_x) & \
-            (population[:, X] <= x + range_x) & \
-            (population[:, Y] >= y - range_y) & \
-            (population[:, Y] <= y + range_y)
-        population[:, DESTINATION_ARRIVED][arrivals_index] = 1
-
-    return population
-
-
-def stay_at_destination(population, destinations):
+    population[citizens, DESTINATION] = destination_index
+    population[citizens, DESTINATION_ARRIVED] = 0
+
+
+def update_destinations(population: Population, destinations, rng: np.random.Generator, buffers: ScratchBuffers = None, instrumentation=None, backend: str = BACKEND_NUMPY):
     """
-    Ensure that citizens who arrived at destination will stay in perimeter
+    Arrival, steering and confinement of all citizens with a destination in one pass.
+
+    The destination of every citizen is gathered by index from the destination table,
+    so the cost does not depend on the number of destinations.
     """
-    active_destinations = np.unique(population[:, DESTINATION][population[:, DESTINATION] != 0])
-    for destination_index in active_destinations:
-        destination_index = int(destination_index) - 1
-        x = destinations[destination_index, Destination.X.value]
-        y = destinations[destination_index, Destination.Y.value]
-        range_x = destinations[destination_index, Destination.WANDER_RANGE_X.value] / 2
-        range_y = destinations[destination_index, Destination.WANDER_RANGE_Y.value] / 2
-
-        arrivals_index = (population[:, DESTINATION_ARRIVED] == 1) & (population[:, DESTINATION] == destination_index + 1)
-        number_of_arrived = len(population[arrivals_index])
-        if number_of_arrived > 0:
-            xbounds = np.array([[x - range_x, x + range_x]] * number_of_arrived)
-            ybounds = np.array([[y - range_y, y + range_y]] * number_of_arrived)
-            population[arrivals_index] = update_out_of_bounds(population[arrivals_index], xbounds, ybounds)
-    return population
+    if buffers is None:
+        buffers = ScratchBuffers(population.shape[:-1])
+    destination = population[..., DESTINATION]
+    arrived = population[..., DESTINATION_ARRIVED]
+
+    has_destination = np.not_equal(destination, 0, out=buffers.where)
+    if not has_destination.any():
+        return population
+
+    # Gather destination perimeter per citizen, wanderers (index -1) are clipped and masked out later
+    index = np.subtract(destination, 1, out=buffers.index, dtype=np.intp)
+    lower_x, upper_x, lower_y, upper_y = buffers.bounds
+    _gather_perimeter(destinations, Destination.X.value, Destination.WANDER_RANGE_X.value, index, lower_x, upper_x, buffers.values)
+    _gather_perimeter(destinations, Destination.Y.value, Destination.WANDER_RANGE_Y.value, index, lower_y, upper_y, buffers.values)
+
+    # Arrivals
+    moving = np.equal(arrived, 0, out=buffers.mask)
+    np.logical_and(moving, has_destination, out=moving)
+    arrivals = _inside(population, lower_x, upper_x, lower_y, upper_y, buffers.condition, buffers.inside)
+    np.logical_and(arrivals, moving, out=arrivals)
+    np.copyto(arrived, 1, where=arrivals)
+    if instrumentation is not None:
+        instrumentation.count('arrivals', np.count_nonzero(arrivals))
+    np.logical_and(moving, np.logical_not(arrivals, out=arrivals), out=moving)
+
+    # Head to destination
+    for position, heading, lower, upper in ((X, HEADING_X, lower_x, upper_x), (Y, HEADING_Y, lower_y, upper_y)):
+        center = np.add(lower, upper, out=buffers.values)
+        center *= 0.5
+        center -= population[..., position]
+        np.copyto(population[..., heading], center, where=moving)
+
+    # Stay in perimeter when arrived
+    np.logical_and(has_destination, np.equal(arrived, 1, out=buffers.condition), out=has_destination)
+    return update_out_of_bounds(population, (lower_x, upper_x), (lower_y, upper_y), rng, buffers, where=has_destination, backend=backend)
+
+
+def _gather_perimeter(destinations, center_key, range_key, index, lower, upper, half_range):
+    np.take(destinations[:, center_key], index, out=lower, mode='clip')
+    np.take(destinations[:, range_key], index, out=half_range, mode='clip')
+    half_range *= 0.5
+    np.add(lower, half_range, out=upper)
+    lower -= half_range
+
+
+def _inside(population, lower_x, upper_x, lower_y, upper_y, inside, condition):
+    np.greater_equal(population[..., X], lower_x, out=inside)
+    np.logical_and(inside, np.less_equal(population[..., X], upper_x, out=condition), out=inside)
+    np.logical_and(inside, np.greater_equal(population[..., Y], lower_y, out=condition), out=inside)
+    np.logical_and(inside, np.less_equal(population[..., Y], upper_y, out=condition), out=inside)
+    return inside
@@ -0,0 +1,369 @@
+from multiprocessing import Pipe, Process
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from WorldOfCitizens.log import root_logger
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.population import Population, ActiveSet, DTYPES, X, Y, STATE, STATE_DEAD
+from WorldOfCitizens.destination import update_destinations
+from WorldOfCitizens.movement import ScratchBuffers, MOVEMENT_KEYS, MOVED_KEYS, update_out_of_bounds, update_headings, update_movement
+from WorldOfCitizens.contact import find_contacts
+from WorldOfCitizens.infection import infect_citizens
+from WorldOfCitizens.scenario import Scenario
+from WorldOfCitizens.network import CONTACTS_NETWORK
+from WorldOfCitizens.simulation import Simulation
+from WorldOfCitizens.stat_tracker import StatTracker
+
+
+logger = root_logger.getChild('domain')
+
+# Worker commands
+_RESYNC = 'resync'
+_MOVE = 'move'
+_INFECT = 'infect'
+_STOP = 'stop'
+
+
+class TileGrid(object):
+    """
+    World bounds split into columns x rows tiles. Tiles at the border extend to infinity,
+    so every position belongs to exactly one tile.
+    """
+
+    def __init__(self, x_bounds, y_bounds, columns: int, rows: int):
+        self._origin = (x_bounds[0], y_bounds[0])
+        self._size = ((x_bounds[1] - x_bounds[0]) / columns, (y_bounds[1] - y_bounds[0]) / rows)
+        self._columns = columns
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return self._columns * self._rows
+
+    @property
+    def tile_size(self) -> tuple:
+        return self._size
+
+    def tile_of(self, x, y) -> np.ndarray:
+        column = np.clip(np.floor((x - self._origin[0]) / self._size[0]), 0, self._columns - 1)
+        row = np.clip(np.floor((y - self._origin[1]) / self._size[1]), 0, self._rows - 1)
+        return (row * self._columns + column).astype(np.int32)
+
+    def bounds(self, tile: int) -> tuple:
+        """
+        (lower x, upper x, lower y, upper y) of a tile
+        """
+        row, column = divmod(tile, self._columns)
+        lower_x = self._origin[0] + column * self._size[0] if column > 0 else -np.inf
+        upper_x = self._origin[0] + (column + 1) * self._size[0] if column < self._columns - 1 else np.inf
+        lower_y = self._origin[1] + row * self._size[1] if row > 0 else -np.inf
+        upper_y = self._origin[1] + (row + 1) * self._size[1] if row < self._rows - 1 else np.inf
+        return lower_x, upper_x, lower_y, upper_y
+
+
+class DomainSimulation(Simulation):
+    """
+    Simulates one world split into tiles, every tile is owned by a worker process.
+
+    Population columns live in shared memory. Every tick the workers move the citizens of their
+    tile and find the infections of their healthy citizens, with the sick citizens of the tile and
+    its halo (sick citizens of other tiles within infectionRange of its edges) as sources. Citizens
+    migrate by getting the tile they moved into as new owner. The simulation coordinates the ticks
+    and applies new infections, outcomes, stats, observers and events itself.
+
+    Workers keep an ActiveSet of the citizens they own and never scan the world: the simulation
+    routes the state changes, the migrants and the halo sources published by the workers to the
+    tiles concerned, so the work per tick follows the tile, not the world.
+
+    Every worker has its own random stream, results are reproducible for a seed and tile layout,
+    but differ from the single process Simulation in the individual draws. Call close() or use
+    it as context manager to stop the workers.
+    """
+
+    # Tile layout (columns, rows), also used by load_checkpoint
+    _tiles = (2, 2)
+
+    def __init__(self, config: Config, tiles: tuple = (2, 2), seed=None, stat_tracker: StatTracker = None):
+        self._tiles = tiles
+        super().__init__(config, seed=seed, stat_tracker=stat_tracker)
+
+    def _setup(self, population: Population, destinations, frame: int, stat_tracker: StatTracker, calendar=None, network=None):
+        if population.ndim > 2:
+            raise ValueError('DomainSimulation does not support batched populations')
+        if self._config.contact_model == CONTACTS_NETWORK:
+            raise ValueError('DomainSimulation splits proximity contacts, use contactModel = both')
+        config = self._config
+        self._grid = TileGrid(config.world_x_bounds, config.world_y_bounds, *self._tiles)
+        if min(self._grid.tile_size) < config.infection_range:
+            raise ValueError('Tiles must not be smaller than infectionRange')
+        self._resync = True
+        self._immigrants = self._nobody()
+        self._halo = self._immigrants
+        self._blocks = []
+        shared = Population([self._share(column) for column in population.columns])
+        self._owner = self._share(self._grid.tile_of(population[:, X], population[:, Y]))
+        super()._setup(shared, self._share(destinations), frame, stat_tracker, calendar, network)
+
+        names = [block.name for block in self._blocks]
+        seeds = self._rng.integers(2 ** 63, size=len(self._grid))
+        self._connections = []
+        self._workers = []
+        for tile in range(len(self._grid)):
+            connection, worker_connection = Pipe()
+            worker = Process(
+                target=_work,
+                args=(config, names, len(population), destinations.shape, self._grid, tile,
+                      (self._xbounds, self._ybounds), int(seeds[tile]), worker_connection),
+                name='DomainWorker-{}'.format(tile),
+                daemon=True
+            )
+            worker.start()
+            self._connections.append(connection)
+            self._workers.append(worker)
+
+        # Workers must take their initial citizens before any of them migrates citizens
+        for connection in self._connections:
+            connection.recv()
+        logger.info('Started {} domain workers, tiles={}'.format(len(self._workers), self._tiles))
+
+    @property
+    def owner(self) -> np.ndarray:
+        """
+        Tile owning each citizen
+        """
+        return self._owner
+
+    def close(self):
+        """
+        Stop the workers and release the shared memory, the population stays available as a copy
+        """
+        if not self._workers:
+            return
+        for connection in self._connections:
+            connection.send((_STOP, self._frame, None))
+        for worker in self._workers:
+            worker.join()
+        self._connections = []
+        self._workers = []
+
+        self._population = self._population.copy()
+        self._owner = self._owner.copy()
+        self._destinations = self._destinations.copy()
+        for block in self._blocks:
+            try:
+                block.close()
+            except BufferError:
+                # Views held outside the simulation keep the mapping alive until they are gone
+                pass
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _active_set(self) -> ActiveSet:
+        # Rebuilt from the population, the workers rebuild theirs before the next move
+        self._resync = True
+        return _ChangeLog(self._population)
+
+    def _move(self, instrumentation, counters, ticks=1):
+        with instrumentation.stage('movement'):
+            if self._resync:
+                self._command(_RESYNC)
+                self._resync = False
+                self._immigrants = self._nobody()
+            infected, resolved = self._population.active.changes()
+            infected = self._route(infected, self._owner[infected])
+            resolved = self._route(resolved, self._owner[resolved])
+            results = self._command(_MOVE, [
+                (ticks, immigrants, tile_infected, tile_resolved)
+                for immigrants, tile_infected, tile_resolved in zip(self._immigrants, infected, resolved)
+            ])
+            self._immigrants = self._route(*_concatenate_pairs([emigrants for emigrants, _ in results]))
+            self._halo = self._route(*_concatenate_pairs([halo for _, halo in results]))
+
+    def _infect(self, counters):
+        # Sick citizens at the start of the tick, the tiles take their sources before any infection as well
+        sources = self._population.active.infectious
+        results = self._command(_INFECT, list(zip(self._immigrants, self._halo)))
+        self._immigrants = self._nobody()
+        new_infected = np.sort(np.concatenate([infected for infected, _ in results]))
+        if counters is not None:
+            counters.count('contacts', sum(contacts for _, contacts in results))
+            counters.count('new_infections', len(new_infected))
+        self._population = infect_citizens(self.config, self._population, new_infected, self._frame, self._rng, self._calendar)
+        self._infect_network(counters, sources)
+
+    def _command(self, command, arguments: list = None):
+        """
+        Send command to all workers, with one argument per worker, and wait for all replies,
+        the barrier between the phases of a tick
+        """
+        for tile, connection in enumerate(self._connections):
+            connection.send((command, self._frame, None if arguments is None else arguments[tile]))
+        return [connection.recv() for connection in self._connections]
+
+    def _nobody(self) -> list:
+        return [np.empty(0, dtype=np.int64) for _ in range(len(self._grid))]
+
+    def _route(self, citizens: np.ndarray, tiles: np.ndarray) -> list:
+        """
+        Citizens split by tile, one array per tile
+        """
+        order = np.argsort(tiles, kind='stable')
+        bounds = np.searchsorted(tiles[order], np.arange(len(self._grid) + 1))
+        citizens = citizens[order]
+        return [citizens[bounds[tile]:bounds[tile + 1]] for tile in range(len(self._grid))]
+
+    def _share(self, array: np.ndarray) -> np.ndarray:
+        block = SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._blocks.append(block)
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        shared[...] = array
+        return shared
+
+
+class _ChangeLog(ActiveSet):
+    """
+    ActiveSet of the world which also collects the infected and resolved citizens for the workers
+    """
+
+    def __init__(self, population: Population):
+        super().__init__(population)
+        self._infected = []
+        self._resolved = []
+
+    def infected(self, citizens: np.ndarray):
+        super().infected(citizens)
+        self._infected.append(citizens)
+
+    def resolved(self, citizens: np.ndarray, dead: np.ndarray):
+        super().resolved(citizens, dead)
+        self._resolved.append(citizens)
+
+    def changes(self) -> tuple:
+        """
+        Infected and resolved citizens since the last call
+        """
+        infected = np.concatenate(self._infected).astype(np.int64) if self._infected else np.empty(0, dtype=np.int64)
+        resolved = np.concatenate(self._resolved).astype(np.int64) if self._resolved else np.empty(0, dtype=np.int64)
+        self._infected = []
+        self._resolved = []
+        return infected, resolved
+
+
+def _work(config, names, size, destinations_shape, grid, tile, bounds, seed, connection):
+    """
+    Worker loop of one tile
+    """
+    rng = np.random.default_rng(seed)
+    scenario = Scenario(config)
+    blocks = [SharedMemory(name=name) for name in names]
+    population = Population([np.ndarray(size, dtype=dtype, buffer=block.buf) for dtype, block in zip(DTYPES, blocks)])
+    owner = np.ndarray(size, dtype=np.int32, buffer=blocks[len(DTYPES)].buf)
+    destinations = np.ndarray(destinations_shape, dtype=np.float32, buffer=blocks[len(DTYPES) + 1].buf)
+
+    infection_range = config.infection_range
+    state = population[:, STATE]
+    active = None
+    subset = None
+    capacity = 0
+    connection.send(None)
+
+    while True:
+        command, frame, argument = connection.recv()
+        if command == _RESYNC:
+            active = ActiveSet(population, np.flatnonzero(owner == tile))
+            connection.send(None)
+
+        elif command == _MOVE:
+            ticks, immigrants, infected, resolved = argument
+            _update(active, state, immigrants, infected, resolved)
+
+            # The dead stay where they are
+            moving = active.mobile
+            emigrants = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32))
+            if len(moving) > 0:
+                if len(moving) > capacity:
+                    capacity = 2 * len(moving)
+                    subset = (Population.zeros((capacity,)), ScratchBuffers((capacity,)))
+                citizens = population.take(moving, MOVEMENT_KEYS, subset[0].head(len(moving)))
+                buffers = subset[1].head(len(moving))
+                update_destinations(citizens, destinations, rng, buffers, backend=config.backend)
+                update_out_of_bounds(citizens, bounds[0], bounds[1], rng, buffers, backend=config.backend)
+                update_headings(config, citizens, rng, buffers, ticks)
+                scenario.limit_speed(citizens, frame, moving)
+                update_movement(config, citizens, buffers, ticks)
+                population.put(moving, citizens, MOVED_KEYS)
+
+                # Migration, citizens who left the tile belong to their new tile from now on
+                tiles = grid.tile_of(citizens[:, X], citizens[:, Y])
+                left = tiles != tile
+                emigrants = (moving[left], tiles[left])
+                owner[emigrants[0]] = emigrants[1]
+
+            # Halo sources include the sick emigrants, their new tile only takes them with the next command
+            sick = active.infectious
+            halo = _halo_sources(grid, sick, owner[sick], population[:, X][sick], population[:, Y][sick], infection_range)
+            active.discard(emigrants[0])
+            connection.send((emigrants, halo))
+
+        elif command == _INFECT:
+            immigrants, halo = argument
+            _update(active, state, immigrants)
+            x = population[:, X]
+            y = population[:, Y]
+
+            # Sources are the sick citizens of the tile and its halo
+            sources = np.sort(np.concatenate([active.infectious, halo]))
+            healthy = active.susceptible
+            _, targets = find_contacts(x[sources], y[sources], x[healthy], y[healthy], infection_range, backend=config.backend)
+            del x, y
+
+            # New infections are reported, the simulation applies them after all tiles are done
+            transmissions = rng.random(size=len(targets)) < config.infection_probability
+            connection.send((healthy[np.unique(targets[transmissions])], len(targets)))
+
+        else:
+            break
+
+    del population, owner, destinations, state, subset, active
+    for block in blocks:
+        block.close()
+
+
+def _update(active: ActiveSet, state: np.ndarray, immigrants: np.ndarray, infected: np.ndarray = None, resolved: np.ndarray = None):
+    """
+    Apply the state changes of the owned citizens, then take the immigrants with their current state
+    """
+    if infected is not None:
+        if len(immigrants) > 0:
+            infected = np.setdiff1d(infected, immigrants, assume_unique=True)
+            resolved = np.setdiff1d(resolved, immigrants, assume_unique=True)
+        active.infected(infected)
+        active.resolved(resolved, resolved[state[resolved] == STATE_DEAD])
+    if len(immigrants) > 0:
+        active.add(immigrants, state[immigrants])
+
+
+def _halo_sources(grid: TileGrid, sick: np.ndarray, owners: np.ndarray, x: np.ndarray, y: np.ndarray, infection_range: float) -> tuple:
+    """
+    (citizens, tiles) pairs of the sick citizens within infection_range of tiles other than their owners.
+    Tiles are at least infection_range large, so shifting by the range in all directions reaches every such tile.
+    """
+    tiles = len(grid)
+    keys = []
+    for dx in (-infection_range, 0, infection_range):
+        for dy in (-infection_range, 0, infection_range):
+            if dx == 0 and dy == 0:
+                continue
+            neighbours = grid.tile_of(x + dx, y + dy)
+            other = neighbours != owners
+            keys.append(sick[other] * tiles + neighbours[other])
+    keys = np.unique(np.concatenate(keys))
+    return keys // tiles, (keys % tiles).astype(np.int32)
+
+
+def _concatenate_pairs(pairs: list) -> tuple:
+    return np.concatenate([citizens for citizens, _ in pairs]), np.concatenate([tiles for _, tiles in pairs])
@@ -0,0 +1,104 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from WorldOfCitizens.log import root_logger
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.simulation import Simulation
+from WorldOfCitizens.batch import BatchSimulation
+
+
+# StatTracker curves collected per replicate
+CURVES = ('susceptible', 'infectious', 'recovered', 'fatalities')
+
+logger = root_logger.getChild('ensemble')
+
+
+class EnsembleResult(object):
+    """
+    Curves of all replicates of one parameter point
+    """
+
+    def __init__(self, parameters: dict, curves: dict):
+        self._parameters = parameters
+        self._curves = curves
+
+    @property
+    def parameters(self) -> dict:
+        return self._parameters
+
+    @property
+    def curves(self) -> dict:
+        """
+        {curve name: array of shape (replicates, ticks)}
+        """
+        return self._curves
+
+    @property
+    def replicates(self) -> int:
+        return len(self._curves[CURVES[0]])
+
+    def mean(self, curve: str) -> np.ndarray:
+        return self._curves[curve].mean(axis=0)
+
+    def percentile(self, curve: str, q) -> np.ndarray:
+        return np.percentile(self._curves[curve], q, axis=0)
+
+
+def parameter_grid(grid: dict) -> list:
+    """
+    Cartesian product of {'section.option': [values]} as list of override dicts
+    """
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*[grid[key] for key in keys])]
+
+
+def run_ensemble(config: Config, grid: dict = None, replicates: int = 10, n_ticks: int = 100, seed=None, max_workers: int = None, lockstep: bool = False) -> list:
+    """
+    Run replicates of every parameter point of grid in a process pool.
+
+    Every run gets its own random stream spawned from seed, so results are reproducible
+    independent of the number of workers. With lockstep, all replicates of a point run as one
+    BatchSimulation (one stream per point), which is much faster for small populations.
+    Returns one EnsembleResult per parameter point.
+    """
+    points = parameter_grid(grid or {})
+    # Every point is resolved once, workers get the immutable record
+    configs = [config.override(overrides) for overrides in points]
+    logger.info('Run ensemble, points={} replicates={} ticks={} lockstep={}'.format(len(points), replicates, n_ticks, lockstep))
+
+    if lockstep:
+        streams = np.random.SeedSequence(seed).spawn(len(points))
+        jobs = [(point_config, streams[point_index], n_ticks, replicates) for point_index, point_config in enumerate(configs)]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            runs = list(executor.map(_run_batch, *zip(*jobs)))
+    else:
+        streams = np.random.SeedSequence(seed).spawn(len(points) * replicates)
+        jobs = [
+            (point_config, streams[point_index * replicates + replicate], n_ticks)
+            for point_index, point_config in enumerate(configs)
+            for replicate in range(replicates)
+        ]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            replicate_runs = list(executor.map(_run_replicate, *zip(*jobs)))
+        runs = [
+            np.stack(replicate_runs[point_index * replicates:(point_index + 1) * replicates])
+            for point_index in range(len(points))
+        ]
+
+    results = []
+    for overrides, point_runs in zip(points, runs):
+        curves = {name: point_runs[:, curve_index] for curve_index, name in enumerate(CURVES)}
+        results.append(EnsembleResult(overrides, curves))
+    return results
+
+
+def _run_replicate(config: Config, seed: np.random.SeedSequence, n_ticks: int) -> np.ndarray:
+    stat_tracker = Simulation(config, seed=seed).run(n_ticks)
+    return np.array([getattr(stat_tracker, name) for name in CURVES])
+
+
+def _run_batch(config: Config, seed: np.random.SeedSequence, n_ticks: int, replicates: int) -> np.ndarray:
+    simulation = BatchSimulation(config, replicates, seed=seed)
+    simulation.run(n_ticks)
+    # (replicates, curves, ticks)
+    return np.stack([simulation.curves(name) for name in CURVES], axis=1)
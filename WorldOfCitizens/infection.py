@@ -1,53 +1,80 @@
 import numpy as np
 from WorldOfCitizens.config import Config
-from WorldOfCitizens.population import ID, X, Y, STATE, RECOVERY_DURATION, STATE_HEALTHY, STATE_SICK, INFECTED_SINCE, STATE_DEAD, STATE_IMMUNE, HEADING_X, HEADING_Y, SPEED
-
-
-def infect(config: Config, population, frame: int):
-    healthy = population[population[:, STATE] == STATE_HEALTHY]
-    for patient in healthy:
-        infection_zone = [
-            patient[X] - config.infection_range,
-            patient[Y] - config.infection_range,
-            patient[X] + config.infection_range,
-            patient[Y] + config.infection_range
-        ]
-        # Find healthy people inside infection zone
-        healthy_ids = _find_nearby_ids(population, infection_zone, STATE_HEALTHY)
-        for ind in healthy_ids:
-            if np.random.random() < config.infection_range:
-                population[ind][STATE] = STATE_SICK
-                population[ind][RECOVERY_DURATION] = int(np.random.uniform(low=config.recovery_duration[0], high=config.recovery_duration[1]))
-                population[ind][INFECTED_SINCE] = frame
+from WorldOfCitizens.contact import find_contacts
+from WorldOfCitizens.population import X, Y, STATE, RECOVERY_DURATION, STATE_HEALTHY, STATE_SICK, INFECTED_SINCE
+from WorldOfCitizens.progression import DiseaseCalendar, progress
 
-    return population
 
+def infect(config: Config, population, frame: int, rng: np.random.Generator, instrumentation=None, calendar: DiseaseCalendar = None,
+           sources: np.ndarray = None):
+    """
+    Sick citizens infect healthy citizens inside their infection zone.
+    One Bernoulli trial per contact, all trials of a tick are drawn at once.
+    A population of shape (replicates, citizens, keys) is handled as independent worlds.
+    The outcome of new infections is scheduled in calendar.
+    sources (sorted flat indices) replace the sick citizens of the population, e.g. the sick at the start of the tick.
+    """
+    # Flat views over all replicates
+    x = population[..., X].reshape(-1)
+    y = population[..., Y].reshape(-1)
+    if population.active is not None:
+        sick = population.active.infectious
+        healthy = population.active.susceptible
+    else:
+        state = population[..., STATE].reshape(-1)
+        sick = np.flatnonzero(state == STATE_SICK)
+        healthy = np.flatnonzero(state == STATE_HEALTHY)
+    if sources is not None:
+        sick = sources
+
+    sick_groups = healthy_groups = None
+    if population.ndim > 2:
+        sick_groups = sick // population.shape[-2]
+        healthy_groups = healthy // population.shape[-2]
+
+    _, targets = find_contacts(
+        x[sick], y[sick],
+        x[healthy], y[healthy],
+        config.infection_range,
+        sick_groups, healthy_groups,
+        config.backend
+    )
+
+    transmissions = rng.random(size=len(targets)) < config.infection_probability
+    new_infected = healthy[np.unique(targets[transmissions])]
+    if instrumentation is not None:
+        instrumentation.count('contacts', len(targets))
+        instrumentation.count('new_infections', len(new_infected))
+
+    return infect_citizens(config, population, new_infected, frame, rng, calendar)
+
+
+def infect_citizens(config: Config, population, citizens: np.ndarray, frame: int, rng: np.random.Generator, calendar: DiseaseCalendar = None):
+    """
+    Make citizens (flat indices) sick, draw their recovery duration and schedule the outcome in calendar
+    """
+    recovery_duration = config.recovery_duration
+    population[..., STATE].reshape(-1)[citizens] = STATE_SICK
+    population[..., RECOVERY_DURATION].reshape(-1)[citizens] = rng.uniform(
+        low=recovery_duration[0],
+        high=recovery_duration[1],
+        size=len(citizens)
+    ).astype(int)
+    population[..., INFECTED_SINCE].reshape(-1)[citizens] = frame
+    if population.active is not None:
+        population.active.infected(citizens)
+    if calendar is not None:
+        calendar.schedule_outcome(population, citizens, frame)
 
-def recover_or_die(config: Config, population, frame: int):
-    infected = population[population[:, STATE] == STATE_SICK]
-
-    infected[:, RECOVERY_DURATION] = infected[:, RECOVERY_DURATION] - 1
-    infection_done_ids = infected[:, ID][infected[:, RECOVERY_DURATION] == 0]
-    for id in infection_done_ids:
-        mortality_chance = 0.2
-        if np.random.random() <= mortality_chance:
-            # Die
-            infected[:, STATE][infected[:, ID] == id] = STATE_DEAD
-        else:
-            # Recover
-            infected[:, STATE][infected[:, ID] == id] = STATE_IMMUNE
-    population[population[:, STATE] == STATE_SICK] = infected
     return population
 
 
-def _find_nearby_ids(population, zone, state):
-    inds = np.int32(
-        population[:, ID][
-            (population[:, STATE] == state) &
-            (population[:, X] > zone[0]) &
-            (population[:, Y] > zone[1]) &
-            (population[:, X] < zone[2]) &
-            (population[:, Y] < zone[3])
-        ]
-    )
-    return inds
+def recover_or_die(config: Config, population, frame: int, rng: np.random.Generator, instrumentation=None, calendar: DiseaseCalendar = None):
+    """
+    Sick citizens recover or die when their recovery duration is over, in the last tick of
+    INFECTED_SINCE + RECOVERY_DURATION. Only the citizens due in calendar are touched; without
+    a calendar, one is built from all sick citizens.
+    """
+    if calendar is None:
+        calendar = DiseaseCalendar.from_population(population, frame)
+    return progress(config, population, calendar, frame, rng, instrumentation)
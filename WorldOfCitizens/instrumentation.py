@@ -0,0 +1,150 @@
+import csv
+import json
+import time
+import cProfile
+import pstats
+import tracemalloc
+from WorldOfCitizens.log import root_logger
+
+
+logger = root_logger.getChild('instrumentation')
+
+
+class Instrumentation(object):
+    """
+    Per stage wall clock timers and counters of a simulation, one timeline record per tick.
+
+    Optionally profiles a window of ticks [start, stop) with cProfile and/or tracemalloc,
+    traced_memory_peak is the peak of traced memory during each tick of the window.
+    """
+
+    def __init__(self, profile_ticks: tuple = None, trace_memory_ticks: tuple = None):
+        self._timeline = []
+        self._record = None
+        self._tick_start = 0.0
+        self._stages = {}
+
+        self._profile_ticks = profile_ticks
+        self._profiler = None
+        self._profile_stats = None
+
+        self._trace_memory_ticks = trace_memory_ticks
+        self._memory_snapshot = None
+
+    @property
+    def timeline(self) -> list:
+        return self._timeline
+
+    @property
+    def profile_stats(self) -> pstats.Stats:
+        return self._profile_stats
+
+    @property
+    def memory_snapshot(self) -> tracemalloc.Snapshot:
+        return self._memory_snapshot
+
+    def begin_tick(self, frame: int):
+        self._record = {'frame': frame}
+        if self._profile_ticks is not None and frame == self._profile_ticks[0]:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        if self._trace_memory_ticks is not None and self._trace_memory_ticks[0] <= frame < self._trace_memory_ticks[1]:
+            if frame == self._trace_memory_ticks[0]:
+                tracemalloc.start()
+            # Peak of this tick, not of the window so far
+            tracemalloc.reset_peak()
+        self._tick_start = time.perf_counter()
+
+    def end_tick(self):
+        record = self._record
+        record['tick'] = time.perf_counter() - self._tick_start
+        frame = record['frame']
+
+        if self._trace_memory_ticks is not None and self._trace_memory_ticks[0] <= frame < self._trace_memory_ticks[1]:
+            record['traced_memory_peak'] = tracemalloc.get_traced_memory()[1]
+            if frame == self._trace_memory_ticks[1] - 1:
+                self._memory_snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+        if self._profiler is not None and frame == self._profile_ticks[1] - 1:
+            self._profiler.disable()
+            self._profile_stats = pstats.Stats(self._profiler)
+            self._profiler = None
+
+        self._timeline.append(record)
+
+    def stage(self, name: str):
+        """
+        Context manager timing a stage of the current tick, times of repeated stages are summed up
+        """
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = _StageTimer(self, name)
+        return stage
+
+    def count(self, name: str, value: int):
+        self._record[name] = self._record.get(name, 0) + int(value)
+
+    def to_csv(self, filename: str):
+        keys = []
+        for record in self._timeline:
+            keys.extend(key for key in record if key not in keys)
+        with open(filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=keys, restval=0)
+            writer.writeheader()
+            writer.writerows(self._timeline)
+
+    def to_json(self, filename: str):
+        with open(filename, 'w') as f:
+            json.dump(self._timeline, f)
+
+    def export(self, filename: str):
+        """
+        Write the timeline as JSON or CSV, depending on the file extension
+        """
+        logger.info('Export timeline to {}'.format(filename))
+        if filename.endswith('.json'):
+            self.to_json(filename)
+        else:
+            self.to_csv(filename)
+
+
+class _StageTimer(object):
+    def __init__(self, instrumentation: Instrumentation, name: str):
+        self._instrumentation = instrumentation
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        # Stages entered several times in a tick (coarse steps of a fast forward) add up
+        record = self._instrumentation._record
+        record[self._name] = record.get(self._name, 0.0) + time.perf_counter() - self._start
+
+
+class _NullStage(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class NullInstrumentation(object):
+    """
+    Stands in for Instrumentation when disabled, every call is a no-op
+    """
+    _stage = _NullStage()
+
+    def begin_tick(self, frame: int):
+        pass
+
+    def end_tick(self):
+        pass
+
+    def stage(self, name: str):
+        return self._stage
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
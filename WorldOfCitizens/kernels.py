@@ -0,0 +1,154 @@
+import os
+import numpy as np
+from WorldOfCitizens.log import root_logger
+
+
+BACKEND_NUMPY = 'numpy'
+BACKEND_NUMBA = 'numba'
+
+logger = root_logger.getChild('kernels')
+
+# Replaced by numba.prange when the kernels are compiled
+prange = range
+
+# None: not loaded yet, True: compiled kernels, False: numba is not available
+_loaded = None
+
+
+def jit_enabled(backend: str) -> bool:
+    """
+    True for the numba backend when numba is available. numba is imported and the kernels are
+    compiled on first use, so the numpy backend never pays for it.
+    """
+    if backend != BACKEND_NUMBA:
+        return False
+    if _loaded is None:
+        _load()
+    return _loaded
+
+
+def effective_backend(backend: str) -> str:
+    """
+    Backend actually used for backend, numpy if numba is not available
+    """
+    return BACKEND_NUMBA if jit_enabled(backend) else BACKEND_NUMPY
+
+
+def move(position, heading, speed):
+    """
+    position += heading * speed in a single pass
+    """
+    _move(position.reshape(-1), heading.reshape(-1), speed.reshape(-1))
+
+
+def bounce_masks(position, heading, bounds, where, lower_mask, upper_mask):
+    """
+    Masks of citizens leaving through the lower and upper boundary in a single pass
+    """
+    size = position.size
+    _bounce_masks(
+        position.reshape(-1), heading.reshape(-1),
+        _flat(bounds[0], size, position.dtype), _flat(bounds[1], size, position.dtype),
+        _flat(True if where is None else where, size, np.bool_),
+        lower_mask.reshape(-1), upper_mask.reshape(-1)
+    )
+
+
+def expand_contacts(sources_x, sources_y, source_cx, source_cy, targets_x, targets_y, sorted_keys, target_order, rows, contact_range):
+    """
+    All in-zone (source, target) pairs of the 3x3 neighbourhood of each source, in two parallel passes.
+    Pairs are ordered by source, then target.
+    """
+    contact_range = sources_x.dtype.type(contact_range)
+    counts = np.empty(len(sources_x), dtype=np.intp)
+    _contacts(sources_x, sources_y, source_cx, source_cy, targets_x, targets_y, sorted_keys, target_order, rows, contact_range, counts, counts, False)
+
+    offsets = np.cumsum(counts) - counts
+    targets = np.empty(counts.sum(), dtype=np.intp)
+    _contacts(sources_x, sources_y, source_cx, source_cy, targets_x, targets_y, sorted_keys, target_order, rows, contact_range, offsets, targets, True)
+    sources = np.repeat(np.arange(len(sources_x)), counts)
+    return sources, targets
+
+
+def _flat(values, size, dtype):
+    values = np.asarray(values, dtype=dtype)
+    if values.ndim == 0:
+        return np.broadcast_to(values, (size,))
+    return values.reshape(-1)
+
+
+def _move_py(position, heading, speed):
+    for i in prange(position.shape[0]):
+        position[i] += heading[i] * speed[i]
+
+
+def _bounce_masks_py(position, heading, lower, upper, where, lower_mask, upper_mask):
+    for i in prange(position.shape[0]):
+        lower_mask[i] = where[i] and position[i] <= lower[i] and heading[i] < 0
+        upper_mask[i] = where[i] and position[i] >= upper[i] and heading[i] > 0
+
+
+def _lower_bound_py(keys, key):
+    low = 0
+    high = keys.shape[0]
+    while low < high:
+        middle = (low + high) // 2
+        if keys[middle] < key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def _contacts_py(sources_x, sources_y, source_cx, source_cy, targets_x, targets_y, sorted_keys, target_order, rows, contact_range, offsets, targets, fill):
+    """
+    Counts the contacts per source into offsets (fill=False) or writes them to targets starting at offsets (fill=True)
+    """
+    for i in prange(sources_x.shape[0]):
+        found = 0
+        for dx in range(-1, 2):
+            for dy in range(-1, 2):
+                key = (source_cx[i] + dx) * rows + source_cy[i] + dy
+                start = _lower_bound(sorted_keys, key)
+                end = _lower_bound(sorted_keys, key + 1)
+                for j in range(start, end):
+                    target = target_order[j]
+                    if targets_x[target] > sources_x[i] - contact_range and \
+                            targets_y[target] > sources_y[i] - contact_range and \
+                            targets_x[target] < sources_x[i] + contact_range and \
+                            targets_y[target] < sources_y[i] + contact_range:
+                        if fill:
+                            targets[offsets[i] + found] = target
+                        found += 1
+        if fill:
+            # Same order as the numpy backend: by source, then target
+            targets[offsets[i]:offsets[i] + found].sort()
+        else:
+            offsets[i] = found
+
+
+def _load():
+    global _loaded, prange, _move, _bounce_masks, _lower_bound, _contacts
+    try:
+        import numba
+    except ImportError:
+        logger.warning('numba is not available, using numpy backend')
+        _loaded = False
+        return
+    if 'NUMBA_THREADING_LAYER' not in os.environ:
+        # Workers of DomainSimulation and ensembles are forked: with TBB the process hangs at exit
+        # after a fork, GNU OpenMP aborts the forked workers, the workqueue layer survives forks
+        numba.config.THREADING_LAYER = 'workqueue'
+    # The kernels look up prange and _lower_bound as globals when numba compiles them
+    prange = numba.prange
+    _move = numba.njit(parallel=True, cache=True)(_move_py)
+    _bounce_masks = numba.njit(parallel=True, cache=True)(_bounce_masks_py)
+    _lower_bound = numba.njit(cache=True)(_lower_bound_py)
+    _contacts = numba.njit(parallel=True, cache=True)(_contacts_py)
+    _loaded = True
+
+
+_move = _move_py
+_bounce_masks = _bounce_masks_py
+_lower_bound = _lower_bound_py
+_contacts = _contacts_py
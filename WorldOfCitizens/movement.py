@@ -1,107 +1,141 @@
 import numpy as np
 from WorldOfCitizens.config import Config
-from WorldOfCitizens.population import X, Y, HEADING_Y, HEADING_X, SPEED
-
-
-def update_out_of_bounds(population, xbounds, ybounds):
-    # Check x lower boundary
-    shp = population[:, HEADING_X][
-        (population[:, X] <= xbounds[:, 0]) & (population[:, HEADING_X] < 0)
-    ].shape
-    population[:, HEADING_X][
-        (population[:, X] < xbounds[:, 0]) & (population[:, HEADING_X] < 0)
-    ] = np.clip(
-        np.random.normal(
-            loc=0.5,
-            scale=0.5 / 3,
-            size=shp
-        ),
-        a_min=0.05,
-        a_max=1
-    )
-
-    # Check x upper boundary
-    shp = population[:, HEADING_X][
-        (population[:, X] >= xbounds[:, 1]) & (population[:, HEADING_X] > 0)
-    ].shape
-    population[:, HEADING_X][
-        (population[:, X] >= xbounds[:, 1]) & (population[:, HEADING_X] > 0)
-    ] = np.clip(
-        -np.random.normal(
-            loc=0.5,
-            scale=0.5 / 3,
-            size=shp
-        ),
-        a_min=-1,
-        a_max=-0.05
-    )
-
-    # Check y lower boundary
-    shp = population[:, HEADING_Y][
-        (population[:, Y] <= ybounds[:, 0]) & (population[:, HEADING_Y] < 0)
-    ].shape
-    population[:, HEADING_Y][
-        (population[:, Y] <= ybounds[:, 0]) & (population[:, HEADING_Y] < 0)
-    ] = np.clip(
-        np.random.normal(
-            loc=0.5,
-            scale=0.5 / 3,
-            size=shp
-        ),
-        a_min=0.05,
-        a_max=1
-    )
-
-    # Check y upper boundary
-    shp = population[:, HEADING_Y][
-        (population[:, Y] >= ybounds[:, 1]) & (population[:, HEADING_Y] > 0)
-    ].shape
-    population[:, HEADING_Y][
-        (population[:, Y] >= ybounds[:, 1]) & (population[:, HEADING_Y] > 0)
-    ] = np.clip(
-        -np.random.normal(
-            loc=0.5,
-            scale=0.5 / 3,
-            size=shp
-        ),
-        a_min=-1,
-        a_max=-0.05
-    )
+from WorldOfCitizens import kernels
+from WorldOfCitizens.population import Population, X, Y, HEADING_Y, HEADING_X, SPEED, DESTINATION, DESTINATION_ARRIVED
 
+
+# Columns read by the movement stages (destinations, bounds, headings, movement) and the ones they change
+MOVEMENT_KEYS = (X, Y, HEADING_X, HEADING_Y, SPEED, DESTINATION, DESTINATION_ARRIVED)
+MOVED_KEYS = (X, Y, HEADING_X, HEADING_Y, SPEED, DESTINATION_ARRIVED)
+
+
+class ScratchBuffers(object):
+    """
+    Preallocated masks, gather and random number buffers, reused by the movement and destination pipeline every tick
+    """
+
+    def __init__(self, shape):
+        self.mask = np.empty(shape, dtype=bool)
+        self.condition = np.empty(shape, dtype=bool)
+        self.where = np.empty(shape, dtype=bool)
+        self.inside = np.empty(shape, dtype=bool)
+        self.index = np.empty(shape, dtype=np.intp)
+        self.bounds = np.empty((4,) + tuple(shape), dtype=np.float32)
+        self.uniform = np.empty(shape, dtype=np.float32)
+        self.values = np.empty(shape, dtype=np.float32)
+        self.normal = np.empty(int(np.prod(shape)), dtype=np.float32)
+
+    def head(self, size: int):
+        """
+        Buffers for the first size citizens of one-dimensional buffers, views into these
+        """
+        buffers = ScratchBuffers.__new__(ScratchBuffers)
+        for name, buffer in vars(self).items():
+            setattr(buffers, name, buffer[..., :size])
+        return buffers
+
+
+def update_out_of_bounds(population: Population, xbounds, ybounds, rng: np.random.Generator, buffers: ScratchBuffers = None, where=None, backend: str = kernels.BACKEND_NUMPY):
+    """
+    Turn citizens around who reached a boundary while heading out.
+    Bounds are (lower, upper) pairs of scalars or arrays broadcastable to the population,
+    where optionally restricts the check to a subset of citizens, backend selects the kernels.
+    """
+    if buffers is None:
+        buffers = ScratchBuffers(population.shape[:-1])
+    _bounce(population[..., X], population[..., HEADING_X], xbounds, rng, buffers, where, backend)
+    _bounce(population[..., Y], population[..., HEADING_Y], ybounds, rng, buffers, where, backend)
     return population
 
 
-def update_headings(config: Config, population):
+def update_headings(config: Config, population: Population, rng: np.random.Generator, buffers: ScratchBuffers = None, ticks: int = 1):
+    """
+    Random new headings and speeds, with the probability of ticks ticks for coarse steps
+    """
+    if buffers is None:
+        buffers = ScratchBuffers(population.shape[:-1])
+    probability = 1 - (1 - config.heading_update_probability) ** ticks
+    heading_multiplicator = config.heading_multiplicator
+    init_avg_speed = config.init_avg_speed
+
     # Update heading x
-    update = np.random.random(size=(config.popuplation_size,))
-    shp = update[update <= config.heading_update_probability].shape
-    population[:, HEADING_X][update < config.heading_update_probability] = np.random.normal(
-        loc=0,
-        scale=1 / 3,
-        size=shp
-    ) * config.heading_multiplicator
+    _draw_updates(probability, rng, buffers)
+    _assign_normal(population[..., HEADING_X], buffers.mask, rng, buffers, 0, 1 / 3, heading_multiplicator)
 
     # Update heading y
-    update = np.random.random(size=(config.popuplation_size))
-    shp = update[update <= config.heading_update_probability].shape
-    population[:, HEADING_Y][update < config.heading_update_probability] = np.random.normal(
-        loc=0,
-        scale=1 / 3,
-        size=shp
-    ) * config.heading_multiplicator
-
-    update = np.random.random(size=(config.popuplation_size,))
-    shp = update[update <= config.heading_update_probability].shape
-    population[:, SPEED][update <= config.heading_update_probability] = np.random.normal(
-        loc=config.init_avg_speed,
-        scale=config.init_avg_speed / 3,
-        size=shp
-    ) * config.speed_multiplicator
+    _draw_updates(probability, rng, buffers)
+    _assign_normal(population[..., HEADING_Y], buffers.mask, rng, buffers, 0, 1 / 3, heading_multiplicator)
+
+    # Update speed
+    _draw_updates(probability, rng, buffers)
+    _assign_normal(population[..., SPEED], buffers.mask, rng, buffers, init_avg_speed, init_avg_speed / 3, config.speed_multiplicator)
 
     return population
 
 
-def update_movement(config: Config, population):
-    population[:, X] = population[:, X] + (population[:, HEADING_X] * population[:, SPEED])
-    population[:, Y] = population[:, Y] + (population[:, HEADING_Y] * population[:, SPEED])
+def update_movement(config: Config, population: Population, buffers: ScratchBuffers = None, ticks: int = 1):
+    """
+    Move by heading * speed per tick, ticks ticks at once for coarse steps
+    """
+    if kernels.jit_enabled(config.backend) and ticks == 1:
+        kernels.move(population[..., X], population[..., HEADING_X], population[..., SPEED])
+        kernels.move(population[..., Y], population[..., HEADING_Y], population[..., SPEED])
+        return population
+
+    if buffers is None:
+        buffers = ScratchBuffers(population.shape[:-1])
+    for position, heading in ((X, HEADING_X), (Y, HEADING_Y)):
+        np.multiply(population[..., heading], population[..., SPEED], out=buffers.values)
+        if ticks != 1:
+            buffers.values *= ticks
+        population[..., position] += buffers.values
     return population
+
+
+def _bounce(position, heading, bounds, rng, buffers, where, backend):
+    mask = buffers.mask
+    condition = buffers.condition
+
+    if kernels.jit_enabled(backend):
+        kernels.bounce_masks(position, heading, bounds, where, mask, condition)
+        _assign_normal(heading, mask, rng, buffers, 0.5, 0.5 / 3, a_min=0.05, a_max=1)
+        _assign_normal(heading, condition, rng, buffers, -0.5, 0.5 / 3, a_min=-1, a_max=-0.05)
+        return
+
+    # Lower boundary
+    np.less_equal(position, bounds[0], out=mask)
+    np.less(heading, 0, out=condition)
+    np.logical_and(mask, condition, out=mask)
+    if where is not None:
+        np.logical_and(mask, where, out=mask)
+    _assign_normal(heading, mask, rng, buffers, 0.5, 0.5 / 3, a_min=0.05, a_max=1)
+
+    # Upper boundary
+    np.greater_equal(position, bounds[1], out=mask)
+    np.greater(heading, 0, out=condition)
+    np.logical_and(mask, condition, out=mask)
+    if where is not None:
+        np.logical_and(mask, where, out=mask)
+    _assign_normal(heading, mask, rng, buffers, -0.5, 0.5 / 3, a_min=-1, a_max=-0.05)
+
+
+def _draw_updates(probability, rng, buffers):
+    rng.random(out=buffers.uniform, dtype=np.float32)
+    np.less(buffers.uniform, probability, out=buffers.mask)
+
+
+def _assign_normal(column, mask, rng, buffers, loc, scale, multiplicator=1, a_min=None, a_max=None):
+    """
+    Assign normal distributed values to column where mask is set, drawn into the scratch buffer
+    """
+    count = np.count_nonzero(mask)
+    if count == 0:
+        return
+    values = buffers.normal[:count]
+    rng.standard_normal(out=values, dtype=np.float32)
+    values *= scale
+    values += loc
+    if a_min is not None:
+        np.clip(values, a_min, a_max, out=values)
+    values *= multiplicator
+    column[mask] = values
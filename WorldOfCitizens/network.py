@@ -0,0 +1,184 @@
+import numpy as np
+from WorldOfCitizens.log import root_logger
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.population import Population, STATE, DESTINATION, DESTINATION_ARRIVED, STATE_SICK, STATE_HEALTHY, STATE_DEAD
+from WorldOfCitizens.infection import infect_citizens
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+
+# Contact models
+CONTACTS_PROXIMITY = 'proximity'
+CONTACTS_NETWORK = 'network'
+CONTACTS_BOTH = 'both'
+
+logger = root_logger.getChild('network')
+
+
+class ContactNetwork(object):
+    """
+    Contacts of citizens beyond proximity: households and workplaces as a symmetric sparse (CSR)
+    matrix of contact weights per tick, and destinations, where all citizens who arrived at the
+    same destination meet destinationContacts of the others per tick.
+
+    Citizens are flat indices over all replicates, groups never span replicates. The infection
+    pressure on every citizen is the product of the matrix with the vector of sick citizens,
+    computed from the rows of the sick only.
+    """
+
+    def __init__(self, matrix, households: np.ndarray, workplaces: np.ndarray, citizens: int, venues: int, destination_contacts: float):
+        self._matrix = matrix
+        self._households = households
+        self._workplaces = workplaces
+        self._citizens = citizens
+        self._venues = venues
+        self._destination_contacts = destination_contacts
+
+    @classmethod
+    def build(cls, config: Config, population: Population, destinations: np.ndarray, rng: np.random.Generator):
+        """
+        Random households and workplaces with sizes of 1 + Poisson(size - 1) for every replicate
+        """
+        if sparse is None:
+            raise ImportError('The contact network needs scipy')
+        citizens = population.shape[-2]
+        replicates = int(np.prod(population.shape[:-2], dtype=np.int64))
+        households = _assign_groups(citizens, replicates, config.household_size, rng)
+        workplaces = _assign_groups(citizens, replicates, config.workplace_size, rng)
+
+        size = citizens * replicates
+        matrix = _clique_matrix(households, size, config.household_weight) + \
+            _clique_matrix(workplaces, size, config.workplace_weight)
+        logger.info('Built contact network, citizens={} edges={}'.format(size, matrix.nnz))
+        return cls(matrix.tocsr(), households, workplaces, citizens, len(destinations) + 1, config.destination_contacts)
+
+    @property
+    def matrix(self):
+        """
+        Contact weights per tick between citizens (flat indices), scipy CSR matrix
+        """
+        return self._matrix
+
+    @property
+    def households(self) -> np.ndarray:
+        return self._households
+
+    @property
+    def workplaces(self) -> np.ndarray:
+        return self._workplaces
+
+    def pressure(self, population: Population, sick: np.ndarray, alive: np.ndarray = None) -> np.ndarray:
+        """
+        Expected contacts with sick citizens per tick for every citizen (flat)
+        """
+        size = self._matrix.shape[0]
+        rows = self._matrix[sick]
+        pressure = np.bincount(rows.indices, weights=rows.data, minlength=size).astype(np.float64, copy=False)
+        if self._destination_contacts > 0:
+            pressure += self._destination_pressure(population, sick, alive)
+        return pressure
+
+    def _destination_pressure(self, population, sick, alive):
+        # Venue of every citizen: its destination when arrived, per replicate
+        venue = population[..., DESTINATION].reshape(-1).astype(np.int64)
+        venue[population[..., DESTINATION_ARRIVED].reshape(-1) != 1] = 0
+        if population.ndim > 2:
+            venue += np.arange(len(venue)) // self._citizens * self._venues
+        if alive is None:
+            alive = np.flatnonzero(population[..., STATE].reshape(-1) != STATE_DEAD)
+        venues = self._venues * (len(venue) // self._citizens)
+
+        present = np.bincount(venue[alive], minlength=venues)
+        infectious = np.bincount(venue[sick], minlength=venues)
+        rate = self._destination_contacts * infectious / np.maximum(present - 1, 1)
+        # Venue 0 of every replicate: not at a destination
+        rate[::self._venues] = 0
+        return rate[venue]
+
+    def save(self, filename: str):
+        matrix = self._matrix
+        np.savez(
+            filename, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr, shape=matrix.shape,
+            households=self._households, workplaces=self._workplaces, citizens=self._citizens, venues=self._venues
+        )
+
+    @classmethod
+    def load(cls, filename: str, config: Config):
+        if sparse is None:
+            raise ImportError('The contact network needs scipy')
+        with np.load(filename) as arrays:
+            matrix = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['shape']))
+            return cls(matrix, arrays['households'], arrays['workplaces'], int(arrays['citizens']), int(arrays['venues']), config.destination_contacts)
+
+
+def infect_network(config: Config, population: Population, network: ContactNetwork, frame: int, rng: np.random.Generator, instrumentation=None, calendar=None,
+                   sources: np.ndarray = None):
+    """
+    Sick citizens infect healthy citizens along the contact network. A healthy citizen with an
+    infection pressure of n contacts gets infected with 1 - (1 - infectionPropability)^n.
+    sources (sorted flat indices) replace the sick citizens of the population, e.g. the sick at the start of the tick.
+    """
+    if population.active is not None:
+        sick = population.active.infectious
+        healthy = population.active.susceptible
+        alive = population.active.mobile
+    else:
+        state = population[..., STATE].reshape(-1)
+        sick = np.flatnonzero(state == STATE_SICK)
+        healthy = np.flatnonzero(state == STATE_HEALTHY)
+        alive = None
+    if sources is not None:
+        sick = sources
+
+    pressure = network.pressure(population, sick, alive)[healthy]
+    exposed = np.flatnonzero(pressure > 0)
+    if config.infection_probability < 1:
+        probability = -np.expm1(pressure[exposed] * np.log1p(-config.infection_probability))
+    else:
+        # log1p(-1) is -inf, every contact infects
+        probability = np.ones(len(exposed))
+    new_infected = healthy[exposed[rng.random(size=len(exposed)) < probability]]
+    if instrumentation is not None:
+        instrumentation.count('exposed', len(exposed))
+        instrumentation.count('new_infections', len(new_infected))
+
+    return infect_citizens(config, population, new_infected, frame, rng, calendar)
+
+
+def _assign_groups(citizens: int, replicates: int, mean_size: float, rng: np.random.Generator) -> np.ndarray:
+    """
+    Group of every citizen (flat), groups of random members numbered over all replicates
+    """
+    groups = np.empty(citizens * replicates, dtype=np.int64)
+    first = 0
+    for replicate in range(replicates):
+        sizes = 1 + rng.poisson(mean_size - 1, size=citizens)
+        count = np.searchsorted(np.cumsum(sizes), citizens) + 1
+        labels = np.repeat(np.arange(count), sizes[:count])[:citizens]
+        groups[replicate * citizens:(replicate + 1) * citizens] = first + labels[rng.permutation(citizens)]
+        first += count
+    return groups
+
+
+def _clique_matrix(groups: np.ndarray, size: int, weight: float):
+    """
+    Everybody knows everybody within a group, weight per pair and direction
+    """
+    if weight == 0:
+        return sparse.coo_matrix((size, size), dtype=np.float32)
+    order = np.argsort(groups, kind='stable')
+    _, starts, counts = np.unique(groups[order], return_index=True, return_counts=True)
+
+    # Every member is paired with all members of its group
+    member_counts = np.repeat(counts, counts)
+    member_starts = np.repeat(starts, counts)
+    offsets = np.arange(member_counts.sum()) - np.repeat(np.cumsum(member_counts) - member_counts, member_counts)
+    rows = np.repeat(order, member_counts)
+    columns = order[np.repeat(member_starts, member_counts) + offsets]
+
+    pairs = rows != columns
+    data = np.full(np.count_nonzero(pairs), weight, dtype=np.float32)
+    return sparse.coo_matrix((data, (rows[pairs], columns[pairs])), shape=(size, size))
@@ -18,6 +18,24 @@ DESTINATION_ARRIVED = 10    # 0:No, 1:Arrived at destination (switch to wanderin
 WANDER_RANGE_X = 11         # x-range of wandering when reached a destination
 WANDER_RANGE_Y = 12         # y-range of wandering when reached a destination
 
+# Storage type per key
+DTYPES = [
+    np.int32,       # ID
+    np.float32,     # X
+    np.float32,     # Y
+    np.float32,     # HEADING_X
+    np.float32,     # HEADING_Y
+    np.float32,     # SPEED
+    np.uint8,       # STATE
+    np.int32,       # INFECTED_SINCE
+    np.int16,       # RECOVERY_DURATION
+    np.uint16,      # DESTINATION
+    np.uint8,       # DESTINATION_ARRIVED
+    np.float32,     # WANDER_RANGE_X
+    np.float32,     # WANDER_RANGE_Y
+]
+KEYS = len(DTYPES)
+
 # Valid state values
 STATE_HEALTHY = 0
 STATE_SICK = 1
@@ -25,6 +43,9 @@ STATE_IMMUNE = 2
 STATE_DEAD = 3
 STATE_IMMUNDE_BUT_INFECTIOUS = 4
 
+# Number of state values, including STATE_IMMUNDE_BUT_INFECTIOUS
+N_STATES = 5
+
 # Destination
 DESTINATION_WANDERING = 0
 
@@ -32,60 +53,221 @@ DESTINATION_WANDERING = 0
 logger = root_logger.getChild('population')
 
 
-def initialize_population(config: Config) -> np.ndarray:
+class Population(object):
+    """
+    Citizens stored as one contiguous array per key (structure of arrays).
+
+    Indexing follows the former (citizens, keys) matrix: population[..., X] or population[:, X]
+    return the X array itself (writable), population[rows, X] a selection of it and
+    population[rows] a new Population holding the selected citizens.
+    Columns have the shape (citizens,) or (replicates, citizens) for batched simulations.
+    active holds the ActiveSet maintained by a simulation, or None.
+    """
+
+    def __init__(self, columns: list):
+        self._columns = columns
+        self.active = None
+
+    @classmethod
+    def zeros(cls, shape):
+        return cls([np.zeros(shape, dtype=dtype) for dtype in DTYPES])
+
+    @property
+    def columns(self) -> list:
+        return self._columns
+
+    @property
+    def shape(self) -> tuple:
+        return self._columns[ID].shape + (KEYS,)
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self._columns)
+
+    def __len__(self):
+        return len(self._columns[ID])
+
+    def __getitem__(self, key):
+        if _is_column_key(key):
+            rows = key[:-1]
+            column = self._columns[key[-1]]
+            if _is_all_rows(rows):
+                return column
+            return column[rows]
+        return Population([column[key] for column in self._columns])
+
+    def __setitem__(self, key, value):
+        if _is_column_key(key):
+            self._columns[key[-1]][key[:-1]] = value
+            return
+        for column, values in zip(self._columns, value.columns):
+            column[key] = values
+
+    def copy(self):
+        return Population([column.copy() for column in self._columns])
+
+    def head(self, size: int):
+        """
+        First size citizens of a one-dimensional population, the columns are views
+        """
+        return Population([column[:size] for column in self._columns])
+
+    def take(self, index: np.ndarray, keys, out):
+        """
+        Gather keys of the citizens at flat index (over all replicates) into the population out
+        """
+        for key in keys:
+            np.take(self._columns[key].reshape(-1), index, out=out.columns[key])
+        return out
+
+    def put(self, index: np.ndarray, source, keys):
+        """
+        Scatter keys of the population source back to the citizens at flat index
+        """
+        for key in keys:
+            self._columns[key].reshape(-1)[index] = source.columns[key]
+
+
+class ActiveSet(object):
+    """
+    Sorted flat indices (over all replicates) of the mobile (alive), dead, infectious and susceptible
+    citizens. Updated by the state transitions, so the tick loop does not scan the population for them.
+    Changing STATE directly requires building a new one.
+    With citizens (sorted flat indices), only these citizens are tracked, add() and discard() change them.
+    """
+
+    def __init__(self, population: Population, citizens: np.ndarray = None):
+        state = population[..., STATE].reshape(-1)
+        self.size = len(state)
+        if citizens is None:
+            self.mobile = np.flatnonzero(state != STATE_DEAD)
+            self.dead = np.flatnonzero(state == STATE_DEAD)
+            self.infectious = np.flatnonzero(state == STATE_SICK)
+            self.susceptible = np.flatnonzero(state == STATE_HEALTHY)
+        else:
+            state = state[citizens]
+            self.mobile = citizens[state != STATE_DEAD]
+            self.dead = citizens[state == STATE_DEAD]
+            self.infectious = citizens[state == STATE_SICK]
+            self.susceptible = citizens[state == STATE_HEALTHY]
+
+    def infected(self, citizens: np.ndarray):
+        """
+        Healthy citizens got sick
+        """
+        self.susceptible = _remove(self.susceptible, citizens)
+        self.infectious = _insert(self.infectious, citizens)
+
+    def resolved(self, citizens: np.ndarray, dead: np.ndarray):
+        """
+        Sick citizens recovered or died (dead, a subset of citizens)
+        """
+        self.infectious = _remove(self.infectious, citizens)
+        if len(dead) > 0:
+            self.mobile = _remove(self.mobile, dead)
+            self.dead = _insert(self.dead, dead)
+
+    def add(self, citizens: np.ndarray, state: np.ndarray):
+        """
+        Track citizens (not tracked yet) with their state
+        """
+        self.mobile = _insert(self.mobile, citizens[state != STATE_DEAD])
+        self.dead = _insert(self.dead, citizens[state == STATE_DEAD])
+        self.infectious = _insert(self.infectious, citizens[state == STATE_SICK])
+        self.susceptible = _insert(self.susceptible, citizens[state == STATE_HEALTHY])
+
+    def discard(self, citizens: np.ndarray):
+        """
+        Stop tracking citizens
+        """
+        self.mobile = _remove(self.mobile, citizens)
+        self.dead = _remove(self.dead, citizens)
+        self.infectious = _remove(self.infectious, citizens)
+        self.susceptible = _remove(self.susceptible, citizens)
+
+
+def _insert(index: np.ndarray, citizens: np.ndarray) -> np.ndarray:
+    citizens = np.sort(citizens)
+    return np.insert(index, np.searchsorted(index, citizens), citizens)
+
+
+def _remove(index: np.ndarray, citizens: np.ndarray) -> np.ndarray:
+    if len(index) == 0 or len(citizens) == 0:
+        return index
+    positions = np.minimum(np.searchsorted(index, citizens), len(index) - 1)
+    keep = np.ones(len(index), dtype=bool)
+    keep[positions[index[positions] == citizens]] = False
+    return index[keep]
+
+
+def _is_column_key(key) -> bool:
+    return isinstance(key, tuple) and isinstance(key[-1], (int, np.integer))
+
+
+def _is_all_rows(rows) -> bool:
+    return all(row is Ellipsis or (isinstance(row, slice) and row == slice(None)) for row in rows)
+
+
+def initialize_population(config: Config, rng: np.random.Generator, replicates: int = None) -> Population:
     logger.info('Initialize population, popSize={}'.format(config.popuplation_size))
 
-    population = np.zeros((config.popuplation_size, 13))
+    # One world or replicates of the same world
+    shape = (config.popuplation_size,) if replicates is None else (replicates, config.popuplation_size)
+    population = Population.zeros(shape)
 
     # Create id's
     logger.debug('Apply ids')
-    population[:, ID] = [id for id in range(config.popuplation_size)]
+    population[..., ID] = np.arange(config.popuplation_size)
 
     # Random positions
     logger.debug('Apply random positions')
-    population[:, X] = np.random.uniform(
+    population[..., X] = rng.uniform(
         low=config.world_x_bounds[0] + config.map_padding,
         high=config.world_x_bounds[1] - config.map_padding,
-        size=config.popuplation_size
+        size=shape
     )
-    population[:, Y] = np.random.uniform(
+    population[..., Y] = rng.uniform(
         low=config.world_y_bounds[0] + config.map_padding,
         high=config.world_y_bounds[1] - config.map_padding,
-        size=config.popuplation_size
+        size=shape
     )
 
     # Random headings -1/1
     logger.debug('Apply random headings')
-    population[:, HEADING_X] = np.random.normal(
+    population[..., HEADING_X] = rng.normal(
         loc=0,
         scale=1 / 3,
-        size=(config.popuplation_size,)
+        size=shape
     )
-    population[:, HEADING_Y] = np.random.normal(
+    population[..., HEADING_Y] = rng.normal(
         loc=0,
         scale=1 / 3,
-        size=(config.popuplation_size,)
+        size=shape
     )
 
     # Random speed
     logger.debug('Apply random speed')
-    population[:, SPEED] = np.random.normal(
+    population[..., SPEED] = rng.normal(
         loc=config.init_avg_speed,
         scale=config.init_avg_speed / 3
     )
 
     logger.debug('Apply random recovery vector')
-    population[:, RECOVERY_DURATION] = int(np.random.uniform(
+    population[..., RECOVERY_DURATION] = int(rng.uniform(
         low=config.recovery_duration[0],
         high=config.recovery_duration[1]
     ))
 
     # All alive
-    population[:, STATE] = STATE_HEALTHY
+    population[..., STATE] = STATE_HEALTHY
 
     # No destinations, wandering mod
-    population[:, DESTINATION] = 0
-    population[:, WANDER_RANGE_X] = 0.01
-    population[:, WANDER_RANGE_Y] = 0.01
+    population[..., DESTINATION] = 0
+    population[..., WANDER_RANGE_X] = 0.01
+    population[..., WANDER_RANGE_Y] = 0.01
 
     return population
@@ -0,0 +1,128 @@
+import numpy as np
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.population import STATE, INFECTED_SINCE, RECOVERY_DURATION, HEADING_X, HEADING_Y, STATE_SICK, STATE_DEAD, STATE_IMMUNE
+
+
+# Transitions
+OUTCOME = 0
+
+
+class DiseaseCalendar(object):
+    """
+    Pending disease transitions of citizens, bucketed by the tick they are due.
+
+    Citizens are flat indices into the population (over all replicates), a transition is a code of
+    TRANSITIONS. Each tick only the due citizens are touched. A multi-stage disease model adds a code
+    and a handler, which changes the state of the due citizens and schedules their next transition.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._pending = 0
+
+    def __len__(self) -> int:
+        return self._pending
+
+    def schedule(self, citizens: np.ndarray, ticks: np.ndarray, transition: int = OUTCOME):
+        """
+        Schedule transition of citizens at ticks (one per citizen)
+        """
+        if len(citizens) == 0:
+            return
+        order = np.argsort(ticks, kind='stable')
+        ticks = ticks[order]
+        citizens = citizens[order]
+        unique, starts = np.unique(ticks, return_index=True)
+        for tick, group in zip(unique.tolist(), np.split(citizens, starts[1:])):
+            self._buckets.setdefault(tick, []).append((transition, group))
+        self._pending += len(citizens)
+
+    def pop(self, tick: int) -> dict:
+        """
+        Remove the transitions due at tick, sorted citizens per transition
+        """
+        due = {}
+        for transition, citizens in self._buckets.pop(tick, []):
+            due.setdefault(transition, []).append(citizens)
+        due = {transition: np.sort(np.concatenate(citizens)) for transition, citizens in due.items()}
+        self._pending -= sum(len(citizens) for citizens in due.values())
+        return due
+
+    def to_arrays(self) -> dict:
+        """
+        All pending transitions as flat arrays ticks, transitions and citizens, e.g. for checkpoints
+        """
+        ticks = []
+        transitions = []
+        citizens = []
+        for tick, entries in self._buckets.items():
+            for transition, group in entries:
+                ticks.append(np.full(len(group), tick, dtype=np.int64))
+                transitions.append(np.full(len(group), transition, dtype=np.int64))
+                citizens.append(group)
+        if not citizens:
+            return {name: np.zeros(0, dtype=np.int64) for name in ('ticks', 'transitions', 'citizens')}
+        return {
+            'ticks': np.concatenate(ticks),
+            'transitions': np.concatenate(transitions),
+            'citizens': np.concatenate(citizens).astype(np.int64)
+        }
+
+    @classmethod
+    def from_arrays(cls, ticks: np.ndarray, transitions: np.ndarray, citizens: np.ndarray):
+        calendar = cls()
+        for transition in np.unique(transitions).tolist():
+            selected = transitions == transition
+            calendar.schedule(citizens[selected], ticks[selected], transition)
+        return calendar
+
+    @classmethod
+    def from_population(cls, population, frame: int):
+        """
+        Calendar of the sick citizens of a population, due INFECTED_SINCE + RECOVERY_DURATION,
+        but not before frame
+        """
+        calendar = cls()
+        sick = np.flatnonzero(population[..., STATE].reshape(-1) == STATE_SICK)
+        calendar.schedule_outcome(population, sick, frame)
+        return calendar
+
+    def schedule_outcome(self, population, citizens: np.ndarray, frame: int):
+        """
+        Schedule recovery or death of infected citizens at the end of their RECOVERY_DURATION
+        """
+        end = population[..., INFECTED_SINCE].reshape(-1)[citizens].astype(np.int64) + \
+            population[..., RECOVERY_DURATION].reshape(-1)[citizens] - 1
+        self.schedule(citizens, np.maximum(end, frame), OUTCOME)
+
+
+def progress(config: Config, population, calendar: DiseaseCalendar, frame: int, rng: np.random.Generator, instrumentation=None):
+    """
+    Apply all transitions due at frame
+    """
+    for transition, citizens in sorted(calendar.pop(frame).items()):
+        TRANSITIONS[transition](config, population, calendar, citizens, frame, rng, instrumentation)
+    return population
+
+
+def _outcome(config, population, calendar, citizens, frame, rng, instrumentation):
+    """
+    Sick citizens recover or die, the dead stop moving
+    """
+    state = population[..., STATE].reshape(-1)
+    citizens = citizens[state[citizens] == STATE_SICK]
+    dies = rng.random(size=len(citizens)) <= config.mortality_chance
+    state[citizens] = np.where(dies, STATE_DEAD, STATE_IMMUNE)
+    dead = citizens[dies]
+    population[..., HEADING_X].reshape(-1)[dead] = 0
+    population[..., HEADING_Y].reshape(-1)[dead] = 0
+    if population.active is not None:
+        population.active.resolved(citizens, dead)
+    if instrumentation is not None:
+        instrumentation.count('deaths', np.count_nonzero(dies))
+        instrumentation.count('recoveries', len(dies) - np.count_nonzero(dies))
+
+
+TRANSITIONS = {
+    OUTCOME: _outcome
+}
@@ -0,0 +1,276 @@
+import os
+import json
+import queue
+import threading
+import numpy as np
+from WorldOfCitizens.log import root_logger
+from WorldOfCitizens.population import X, Y, STATE, DESTINATION
+
+
+logger = root_logger.getChild('recorder')
+
+INDEX_FILE = 'index.json'
+
+_QUANTIZATION_STEPS = np.iinfo(np.uint16).max
+
+# Bytes of quantized positions per chunk, limits the ticks of a chunk for large populations
+CHUNK_BYTES = 32 * 2 ** 20
+
+# Position buffers, one chunk is recorded while the other one is compressed
+_POSITION_BUFFERS = 2
+
+
+class TrajectoryRecorder(object):
+    """
+    Simulation observer, appends X, Y, STATE and DESTINATION of every (every-th) tick to a chunked,
+    compressed store in directory path.
+
+    Positions are quantized to uint16 over their range in the tick, STATE and DESTINATION are stored as a key frame per chunk
+    plus the changes of every tick. Chunks are compressed and written by a background thread,
+    the index is updated after every chunk, so a TrajectoryReader in another process can follow
+    the recording. Call close() when the simulation is done.
+
+    A chunk holds chunk_ticks ticks, but at most chunk_bytes of positions. The position buffers
+    of two chunks are allocated once and reused, recording waits for the writer when it falls behind.
+    """
+
+    def __init__(self, path: str, chunk_ticks: int = 100, every: int = 1, chunk_bytes: int = CHUNK_BYTES):
+        os.makedirs(path, exist_ok=True)
+        self._path = path
+        self._chunk_ticks = chunk_ticks
+        self._chunk_bytes = chunk_bytes
+        self._every = every
+
+        self._index = {
+            'chunk_ticks': chunk_ticks,
+            'shape': None,
+            'chunks': []
+        }
+        self._chunk = None
+        self._length = 0
+        self._buffer = None
+        self._previous_state = None
+        self._previous_destination = None
+
+        # Compression and disk access happen off the tick loop
+        self._queue = queue.Queue()
+        self._free_positions = queue.Queue()
+        self._writer = threading.Thread(target=self._write_chunks, name='TrajectoryWriter', daemon=True)
+        self._writer.start()
+
+    def __call__(self, simulation):
+        if simulation.frame % self._every != 0:
+            return
+        population = simulation.population
+        if self._chunk is None:
+            self._start_chunk(population)
+
+        tick = self._length
+        chunk = self._chunk
+        chunk['frames'][tick] = simulation.frame
+        _quantize(population[..., X].reshape(-1), self._buffer, chunk['x'][tick], chunk['x_range'][tick])
+        _quantize(population[..., Y].reshape(-1), self._buffer, chunk['y'][tick], chunk['y_range'][tick])
+
+        state = population[..., STATE].reshape(-1)
+        destination = population[..., DESTINATION].reshape(-1)
+        if tick == 0:
+            chunk['state'] = state.copy()
+            chunk['destination'] = destination.copy()
+        else:
+            _append_changes(chunk, 'state', state, self._previous_state)
+            _append_changes(chunk, 'destination', destination, self._previous_destination)
+        np.copyto(self._previous_state, state)
+        np.copyto(self._previous_destination, destination)
+
+        self._length += 1
+        if self._length == self._chunk_ticks:
+            self._submit()
+
+    def close(self):
+        """
+        Write the last chunk and wait for the writer
+        """
+        if self._chunk is not None:
+            self._submit()
+        self._queue.put(None)
+        self._writer.join()
+
+    def _start_chunk(self, population):
+        size = int(np.prod(population.shape[:-1]))
+        if self._index['shape'] is None:
+            self._index['shape'] = list(population.shape[:-1])
+            self._buffer = np.empty(size, dtype=np.float32)
+            self._previous_state = np.empty(size, dtype=population[..., STATE].dtype)
+            self._previous_destination = np.empty(size, dtype=population[..., DESTINATION].dtype)
+            self._chunk_ticks = max(1, min(self._chunk_ticks, self._chunk_bytes // (2 * np.dtype(np.uint16).itemsize * max(size, 1))))
+            self._index['chunk_ticks'] = self._chunk_ticks
+            for _ in range(_POSITION_BUFFERS):
+                self._free_positions.put((
+                    np.empty((self._chunk_ticks, size), dtype=np.uint16),
+                    np.empty((self._chunk_ticks, size), dtype=np.uint16)
+                ))
+        positions = self._free_positions.get()
+        self._chunk = {
+            'frames': np.zeros(self._chunk_ticks, dtype=np.int64),
+            'positions': positions,
+            'x': positions[0],
+            'y': positions[1],
+            'x_range': np.zeros((self._chunk_ticks, 2), dtype=np.float64),
+            'y_range': np.zeros((self._chunk_ticks, 2), dtype=np.float64),
+            'state_changes': [],
+            'destination_changes': []
+        }
+        self._length = 0
+
+    def _submit(self):
+        chunk = self._chunk
+        length = self._length
+        arrays = {
+            'frames': chunk['frames'][:length],
+            'x': chunk['x'][:length],
+            'y': chunk['y'][:length],
+            'x_range': chunk['x_range'][:length],
+            'y_range': chunk['y_range'][:length],
+            'state': chunk['state'],
+            'destination': chunk['destination']
+        }
+        for name in ('state', 'destination'):
+            changes = chunk[name + '_changes']
+            arrays[name + '_offsets'] = np.cumsum([0] + [len(index) for index, _ in changes])
+            arrays[name + '_index'] = np.concatenate([index for index, _ in changes] or [np.zeros(0, dtype=np.int64)])
+            arrays[name + '_values'] = np.concatenate([values for _, values in changes] or [chunk[name][:0]])
+        self._queue.put((arrays, chunk['positions']))
+        self._chunk = None
+
+    def _write_chunks(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            arrays, positions = item
+            filename = 'chunk_{:06d}.npz'.format(len(self._index['chunks']))
+            np.savez_compressed(os.path.join(self._path, filename), **arrays)
+            self._index['chunks'].append({
+                'file': filename,
+                'first_frame': int(arrays['frames'][0]),
+                'last_frame': int(arrays['frames'][-1]),
+                'ticks': len(arrays['frames'])
+            })
+            _write_index(self._path, self._index)
+            self._free_positions.put(positions)
+            logger.debug('Wrote {}'.format(filename))
+
+
+class TrajectoryReader(object):
+    """
+    Reads a store written by TrajectoryRecorder, read(frame) seeks to any recorded frame
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._cached_file = None
+        self._cached_chunk = None
+        self.refresh()
+
+    def refresh(self):
+        """
+        Reload the index, picks up chunks written since by a running recorder
+        """
+        with open(os.path.join(self._path, INDEX_FILE)) as f:
+            self._index = json.load(f)
+        self._first_frames = np.array([chunk['first_frame'] for chunk in self._index['chunks']])
+
+    @property
+    def shape(self) -> tuple:
+        return tuple(self._index['shape'])
+
+    @property
+    def frames(self) -> np.ndarray:
+        return np.concatenate([self._load(chunk['file'])['frames'] for chunk in self._index['chunks']])
+
+    def read(self, frame: int) -> dict:
+        """
+        Snapshot of a frame: dict with frame, x, y, state and destination
+        """
+        chunk_index = np.searchsorted(self._first_frames, frame, side='right') - 1
+        if chunk_index < 0:
+            raise KeyError('Frame {} not recorded'.format(frame))
+        chunk = self._load(self._index['chunks'][chunk_index]['file'])
+        tick = np.searchsorted(chunk['frames'], frame)
+        if tick >= len(chunk['frames']) or chunk['frames'][tick] != frame:
+            raise KeyError('Frame {} not recorded'.format(frame))
+
+        state = chunk['state'].copy()
+        destination = chunk['destination'].copy()
+        _apply_changes(chunk, 'state', state, 0, tick)
+        _apply_changes(chunk, 'destination', destination, 0, tick)
+        return self._snapshot(chunk, tick, state, destination)
+
+    def __iter__(self):
+        """
+        All recorded frames in order, changes are applied incrementally
+        """
+        for entry in self._index['chunks']:
+            chunk = self._load(entry['file'])
+            state = chunk['state'].copy()
+            destination = chunk['destination'].copy()
+            for tick in range(len(chunk['frames'])):
+                _apply_changes(chunk, 'state', state, tick, tick)
+                _apply_changes(chunk, 'destination', destination, tick, tick)
+                yield self._snapshot(chunk, tick, state.copy(), destination.copy())
+
+    def _snapshot(self, chunk, tick, state, destination):
+        shape = self.shape
+        return {
+            'frame': int(chunk['frames'][tick]),
+            'x': _dequantize(chunk['x'][tick], chunk['x_range'][tick]).reshape(shape),
+            'y': _dequantize(chunk['y'][tick], chunk['y_range'][tick]).reshape(shape),
+            'state': state.reshape(shape),
+            'destination': destination.reshape(shape)
+        }
+
+    def _load(self, filename):
+        if filename != self._cached_file:
+            with np.load(os.path.join(self._path, filename)) as data:
+                self._cached_chunk = {key: data[key] for key in data.files}
+            self._cached_file = filename
+        return self._cached_chunk
+
+
+def _quantize(values, buffer, out, value_range):
+    """
+    Quantize values to uint16 steps between their minimum and maximum, stored in value_range
+    """
+    value_range[0] = values.min()
+    value_range[1] = max(values.max(), value_range[0] + np.finfo(np.float32).eps)
+    # Python floats keep the arithmetic in float32
+    np.subtract(values, float(value_range[0]), out=buffer)
+    buffer *= float(_QUANTIZATION_STEPS / (value_range[1] - value_range[0]))
+    np.rint(buffer, out=buffer)
+    out[...] = buffer
+
+
+def _dequantize(values, value_range):
+    return (values.astype(np.float32) * ((value_range[1] - value_range[0]) / _QUANTIZATION_STEPS) + value_range[0]).astype(np.float32)
+
+
+def _append_changes(chunk, name, values, previous):
+    index = np.flatnonzero(values != previous)
+    chunk[name + '_changes'].append((index, values[index]))
+
+
+def _apply_changes(chunk, name, values, first_tick, last_tick):
+    """
+    Apply the changes of ticks first_tick..last_tick (tick 0 is the key frame, it has none)
+    """
+    offsets = chunk[name + '_offsets']
+    start = offsets[max(first_tick, 1) - 1]
+    end = offsets[last_tick] if last_tick > 0 else start
+    values[chunk[name + '_index'][start:end]] = chunk[name + '_values'][start:end]
+
+
+def _write_index(path, index):
+    temporary = os.path.join(path, INDEX_FILE + '.tmp')
+    with open(temporary, 'w') as f:
+        json.dump(index, f)
+    os.replace(temporary, os.path.join(path, INDEX_FILE))
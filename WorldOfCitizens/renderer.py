@@ -0,0 +1,399 @@
+import os
+import sys
+import queue
+import shutil
+import argparse
+import threading
+import subprocess
+import multiprocessing
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.colors import ListedColormap, Normalize, to_rgb
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+_here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_here, '..')))
+from WorldOfCitizens.log import root_logger
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.population import X, Y, STATE, DESTINATION, STATE_HEALTHY, STATE_SICK, STATE_IMMUNE, N_STATES
+from WorldOfCitizens.destination import Destination, initialize_destinations
+from WorldOfCitizens.contact import density_grid
+from WorldOfCitizens.recorder import TrajectoryReader
+
+
+logger = root_logger.getChild('renderer')
+
+MAP_SCATTER = 'scatter'
+MAP_DENSITY = 'density'
+MAP_AUTO = 'auto'
+
+# Seconds between checks whether the render worker is still alive while waiting for a free queue entry
+WORKER_POLL_INTERVAL = 1.0
+
+
+def take_snapshot(simulation) -> dict:
+    """
+    Copy of everything needed to render the current frame, the first replicate of batched populations
+    """
+    population = simulation.population
+    return {
+        'frame': simulation.frame,
+        'x': _first_replicate(population[..., X]).copy(),
+        'y': _first_replicate(population[..., Y]).copy(),
+        'state': _first_replicate(population[..., STATE]).copy(),
+        'destination': _first_replicate(population[..., DESTINATION]).copy(),
+        'destinations': simulation.destinations.copy()
+    }
+
+
+class FrameRenderer(object):
+    """
+    Draws world map and overview chart of snapshots, creating the artists once and updating them per frame.
+
+    The map shows every citizen (scatter mode) or, for large populations, the number of citizens
+    per grid cell colored by their states (density mode), which costs the same for any population size.
+
+    Without a figure, an Agg figure is created and render() blits the changing artists onto a cached
+    background, so it runs in any thread or process without a display.
+    """
+
+    def __init__(self, config: Config, figure: Figure = None, ticks: int = 1000, dpi: int = 100, mode: str = None):
+        self._config = config
+        self._mode = _resolve_mode(config, mode)
+        animated = figure is None
+        if figure is None:
+            figure = Figure(figsize=(5, 7), dpi=dpi)
+            FigureCanvasAgg(figure)
+        self._figure = figure
+        self._background = None
+
+        gspec = figure.add_gridspec(ncols=1, nrows=2, height_ratios=[5, 2])
+        self._map_ax = figure.add_subplot(gspec[0, 0])
+        self._chart_ax = figure.add_subplot(gspec[1, 0])
+
+        self._title = self._map_ax.set_title('World map, time=0')
+
+        # Healthy, sick, immune, dead, immune but infectious
+        state_colors = [config.color_healthy, config.color_sick, config.color_healthy, config.color_dead, config.color_sick]
+        if self._mode == MAP_DENSITY:
+            density = density_grid(np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.uint8), N_STATES,
+                                   config.world_x_bounds, config.world_y_bounds, config.density_resolution)
+            self._state_colors = np.array([to_rgb(color) for color in state_colors], dtype=np.float32)
+            self._image = np.zeros(density.shape[1:] + (4,), dtype=np.float32)
+            self._citizens = self._map_ax.imshow(
+                self._image, origin='lower', interpolation='nearest', aspect='auto',
+                extent=_density_extent(config, density.shape[1:]))
+        else:
+            self._citizens = self._map_ax.scatter(
+                np.zeros(0), np.zeros(0), c=np.zeros(0), s=2, cmap=ListedColormap(state_colors), norm=Normalize(-0.5, N_STATES - 0.5))
+        self._map_ax.set_xlim(config.world_x_bounds[0], config.world_x_bounds[1])
+        self._map_ax.set_ylim(config.world_y_bounds[0], config.world_y_bounds[1])
+        self._destinations, = self._map_ax.plot([], [], color=config.color_active_destinations, linewidth=1)
+
+        self._chart_ax.set_title('Overview')
+        self._chart_ax.set_xlim(0, ticks)
+        # Growable buffers of the frames and state counts of the chart
+        self._frames = np.zeros(1024, dtype=np.int64)
+        self._counts = np.zeros((1024, N_STATES), dtype=np.int64)
+        self._length = 0
+        self._curves = [
+            (STATE_HEALTHY, self._chart_ax.plot([], [], color=config.color_healthy, label='susceptible')[0]),
+            (STATE_SICK, self._chart_ax.plot([], [], color=config.color_sick, label='infectious')[0]),
+            (STATE_IMMUNE, self._chart_ax.plot([], [], color='yellow', label='recovered')[0])
+        ]
+        self._chart_ax.legend(loc='upper right', fontsize=6)
+
+        self._artists = [self._title, self._citizens, self._destinations] + [line for _, line in self._curves]
+        for artist in self._artists:
+            artist.set_animated(animated)
+
+    @property
+    def figure(self) -> Figure:
+        return self._figure
+
+    def update(self, snapshot: dict):
+        """
+        Update the artists to a snapshot, without drawing
+        """
+        frame = snapshot['frame']
+        state = snapshot['state']
+        self._title.set_text('World map, time={}'.format(frame))
+        if self._mode == MAP_DENSITY:
+            self._update_density(snapshot['x'], snapshot['y'], state)
+        else:
+            self._citizens.set_offsets(np.column_stack([snapshot['x'], snapshot['y']]))
+            self._citizens.set_array(state)
+        if self._config.draw_active_destinations:
+            self._destinations.set_data(*_perimeters(snapshot['destination'], snapshot['destinations']))
+
+        if self._length == len(self._frames):
+            self._frames = np.concatenate([self._frames, np.zeros_like(self._frames)])
+            self._counts = np.concatenate([self._counts, np.zeros_like(self._counts)])
+        self._frames[self._length] = frame
+        self._counts[self._length] = np.bincount(state, minlength=N_STATES)
+        self._length += 1
+        frames = self._frames[:self._length]
+        for state_value, line in self._curves:
+            line.set_data(frames, self._counts[:self._length, state_value])
+
+        # Limits are part of the cached background, changing them forces a full redraw
+        if self._length == 1:
+            self._chart_ax.set_ylim(0, len(state) + 100)
+            self._background = None
+        if frame > self._chart_ax.get_xlim()[1]:
+            self._chart_ax.set_xlim(0, 2 * frame)
+            self._background = None
+
+    def _update_density(self, x, y, state):
+        """
+        Color of a cell is the mix of its citizens' state colors, opacity grows with the log of their number
+        """
+        config = self._config
+        counts = density_grid(x, y, state, N_STATES, config.world_x_bounds, config.world_y_bounds, config.density_resolution)
+        total = counts.sum(axis=0)
+        image = self._image
+        image[..., :3] = np.tensordot(counts.astype(np.float32), self._state_colors, axes=(0, 0))
+        image[..., :3] /= np.maximum(total, 1)[..., np.newaxis]
+        image[..., 3] = np.log1p(total) / np.log1p(max(total.max(), 1))
+        self._citizens.set_data(image)
+
+    def render(self, snapshot: dict) -> np.ndarray:
+        """
+        Update to a snapshot and draw it, returns the RGBA image (valid until the next call)
+        """
+        self.update(snapshot)
+        canvas = self._figure.canvas
+        if self._background is None:
+            canvas.draw()
+            self._background = canvas.copy_from_bbox(self._figure.bbox)
+        else:
+            canvas.restore_region(self._background)
+        for artist in self._artists:
+            self._figure.draw_artist(artist)
+        return np.asarray(canvas.buffer_rgba())
+
+
+class RenderWorker(object):
+    """
+    Simulation observer, renders every every-th tick to output in a background thread or process.
+
+    Snapshots are handed over through a queue of queue_size entries; when rendering falls behind,
+    the simulation waits for a free entry, so memory stays bounded.
+    """
+
+    def __init__(self, config: Config, output: str, every: int = 1, ticks: int = 1000, fps: int = 25,
+                 process: bool = False, queue_size: int = 8):
+        if output.endswith('.mp4'):
+            # Fail before the run instead of in the worker
+            _ffmpeg_path()
+        self._every = every
+        self._error = None
+        if process:
+            self._queue = multiprocessing.Queue(queue_size)
+            self._worker = multiprocessing.Process(target=_render_loop, args=(config, output, ticks, fps, self._queue), daemon=True)
+        else:
+            self._queue = queue.Queue(queue_size)
+            self._worker = threading.Thread(target=self._render, args=(config, output, ticks, fps, self._queue), name='RenderWorker', daemon=True)
+        self._worker.start()
+
+    def __call__(self, simulation):
+        if simulation.frame % self._every == 0:
+            self._put(take_snapshot(simulation))
+
+    def close(self):
+        """
+        Render the queued snapshots and finish the output
+        """
+        self._put(None)
+        self._worker.join()
+        self._check_worker()
+
+    def _render(self, *args):
+        try:
+            _render_loop(*args)
+        except BaseException as error:
+            # Raised in the simulation by the next snapshot or close()
+            logger.error('Rendering failed: {!r}'.format(error))
+            self._error = error
+
+    def _put(self, item):
+        """
+        Wait for a free queue entry as long as the worker is rendering, raise its error when it stopped
+        """
+        while True:
+            try:
+                self._queue.put(item, timeout=WORKER_POLL_INTERVAL)
+                return
+            except queue.Full:
+                if not self._worker.is_alive():
+                    self._check_worker()
+                    raise RuntimeError('Render worker stopped')
+
+    def _check_worker(self):
+        if self._error is not None:
+            raise self._error
+        exitcode = getattr(self._worker, 'exitcode', None)
+        if exitcode:
+            raise RuntimeError('Render process exited with code {}'.format(exitcode))
+
+
+def open_writer(output: str, fps: int = 25):
+    """
+    Image writer for output: .mp4 (ffmpeg), .gif (Pillow) or else a directory of PNG files
+    """
+    if output.endswith('.mp4'):
+        return _FfmpegWriter(output, fps)
+    if output.endswith('.gif'):
+        return _GifWriter(output, fps)
+    return _PngWriter(output)
+
+
+def render_recording(config: Config, recording: str, output: str, every: int = 1, fps: int = 25):
+    """
+    Render a TrajectoryRecorder recording to output
+    """
+    reader = TrajectoryReader(recording)
+    destinations = initialize_destinations(config)
+    frames = reader.frames
+    renderer = FrameRenderer(config, ticks=int(frames[-1]) if len(frames) > 0 else 1000)
+    writer = open_writer(output, fps)
+    for snapshot in reader:
+        if snapshot['frame'] % every != 0:
+            continue
+        for key in ('x', 'y', 'state', 'destination'):
+            snapshot[key] = _first_replicate(snapshot[key])
+        snapshot['destinations'] = destinations
+        writer.write(renderer.render(snapshot), snapshot['frame'])
+    writer.close()
+
+
+def _render_loop(config, output, ticks, fps, snapshots):
+    renderer = FrameRenderer(config, ticks=ticks)
+    writer = open_writer(output, fps)
+    while True:
+        snapshot = snapshots.get()
+        if snapshot is None:
+            break
+        writer.write(renderer.render(snapshot), snapshot['frame'])
+    writer.close()
+    logger.info('Rendered to {}'.format(output))
+
+
+def _resolve_mode(config, mode):
+    mode = config.map_mode if mode is None else mode
+    if mode not in (MAP_SCATTER, MAP_DENSITY, MAP_AUTO):
+        raise ValueError('Unknown map mode {}'.format(mode))
+    if mode == MAP_AUTO:
+        return MAP_DENSITY if config.popuplation_size > config.density_threshold else MAP_SCATTER
+    return mode
+
+
+def _density_extent(config, shape):
+    """
+    Extent of the density grid, its square cells may overlap the upper bounds
+    """
+    x_bounds = config.world_x_bounds
+    y_bounds = config.world_y_bounds
+    cell_size = max(x_bounds[1] - x_bounds[0], y_bounds[1] - y_bounds[0]) / config.density_resolution
+    return (x_bounds[0], x_bounds[0] + shape[1] * cell_size, y_bounds[0], y_bounds[0] + shape[0] * cell_size)
+
+
+def _ffmpeg_path():
+    path = shutil.which(matplotlib.rcParams['animation.ffmpeg_path'])
+    if path is None:
+        raise FileNotFoundError('ffmpeg ({}) not found, it is needed for MP4 output'.format(matplotlib.rcParams['animation.ffmpeg_path']))
+    return path
+
+
+def _first_replicate(column):
+    return column if column.ndim == 1 else column.reshape(-1, column.shape[-1])[0]
+
+
+def _perimeters(destination, destinations):
+    """
+    Perimeters of all destinations in use as one polyline, separated by NaN
+    """
+    in_use = np.bincount(destination, minlength=len(destinations) + 1)[1:] > 0
+    active_destinations = destinations[in_use]
+    x = active_destinations[:, Destination.X.value]
+    y = active_destinations[:, Destination.Y.value]
+    range_x = active_destinations[:, Destination.WANDER_RANGE_X.value] / 2
+    range_y = active_destinations[:, Destination.WANDER_RANGE_Y.value] / 2
+    gap = np.full_like(x, np.nan)
+
+    xs = np.stack([x - range_x, x + range_x, x + range_x, x - range_x, x - range_x, gap], axis=1)
+    ys = np.stack([y - range_y, y - range_y, y + range_y, y + range_y, y - range_y, gap], axis=1)
+    return xs.ravel(), ys.ravel()
+
+
+class _PngWriter(object):
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+
+    def write(self, image, frame):
+        matplotlib.image.imsave(os.path.join(self._directory, 'frame_{:06d}.png'.format(frame)), image)
+
+    def close(self):
+        pass
+
+
+class _GifWriter(object):
+    def __init__(self, filename, fps):
+        # Pillow is only needed for GIF output
+        from PIL import Image
+        self._image = Image
+        self._filename = filename
+        self._duration = 1000 / fps
+        self._frames = []
+
+    def write(self, image, frame):
+        self._frames.append(self._image.fromarray(np.array(image[..., :3])))
+
+    def close(self):
+        if self._frames:
+            self._frames[0].save(self._filename, save_all=True, append_images=self._frames[1:], duration=self._duration, loop=0)
+
+
+class _FfmpegWriter(object):
+    """
+    Pipes raw RGBA frames to ffmpeg, the image size is taken from the first frame
+    """
+
+    def __init__(self, filename, fps):
+        self._executable = _ffmpeg_path()
+        self._filename = filename
+        self._fps = fps
+        self._process = None
+
+    def write(self, image, frame):
+        if self._process is None:
+            height, width = image.shape[:2]
+            self._process = subprocess.Popen([
+                self._executable, '-y', '-loglevel', 'error',
+                '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', '{}x{}'.format(width, height), '-r', str(self._fps), '-i', '-',
+                '-vcodec', 'libx264', '-pix_fmt', 'yuv420p', self._filename
+            ], stdin=subprocess.PIPE)
+        self._process.stdin.write(image.tobytes())
+
+    def close(self):
+        if self._process is not None:
+            self._process.stdin.close()
+            self._process.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render a recorded simulation to MP4, GIF or PNG files')
+    parser.add_argument('recording', help='directory written by --record')
+    parser.add_argument('output', help='.mp4 or .gif file, otherwise a directory for PNG files')
+    parser.add_argument('--config', default='woc-config.ini', help='configuration file')
+    parser.add_argument('--every', type=int, default=1, help='render every n-th recorded tick')
+    parser.add_argument('--fps', type=int, default=25, help='frames per second of videos')
+    args = parser.parse_args(argv)
+
+    render_recording(Config(args.config), args.recording, args.output, every=args.every, fps=args.fps)
+
+
+if __name__ == '__main__':
+    main()
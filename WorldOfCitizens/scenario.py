@@ -0,0 +1,256 @@
+from bisect import bisect_right
+import numpy as np
+from WorldOfCitizens.log import root_logger
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.population import Population, STATE, SPEED, DESTINATION, DESTINATION_ARRIVED, STATE_HEALTHY, STATE_SICK, STATE_IMMUNE, STATE_DEAD
+from WorldOfCitizens.infection import infect_citizens
+
+
+logger = root_logger.getChild('scenario')
+
+# Config sections of events, e.g. [event:lockdown]
+EVENT_PREFIX = 'event:'
+
+# Event actions
+ACTION_SEND = 'send'
+ACTION_QUARANTINE = 'quarantine'
+ACTION_SPEED = 'speed'
+ACTION_SEED = 'seed'
+
+STATES = {
+    'healthy': STATE_HEALTHY,
+    'sick': STATE_SICK,
+    'immune': STATE_IMMUNE,
+    'dead': STATE_DEAD
+}
+
+
+class Scenario(object):
+    """
+    Timeline of interventions, compiled from the [event:<name>] sections of the configuration.
+
+    Every event has a tick (optionally repeated every n ticks until a tick) and an action:
+    * send: send the selected citizens to destination (0: wandering), several destinations split them by fractions
+    * quarantine: send, selecting the sick citizens by default
+    * speed: cap the speed of the selected citizens to limit from tick on, until the next speed event (limit = none lifts it)
+    * seed: infect count (or a fraction of the) healthy selected citizens, per replicate
+    Citizens are selected by citizens = <first>-<last> (index range) and state = healthy|sick|immune|dead.
+
+    Events are applied right before the tick they are scheduled for, all events of a tick are found
+    with one dict lookup. Selections are applied as one vectorized operation per event.
+    """
+
+    def __init__(self, config: Config):
+        self._schedule = {}
+        speed_events = []
+        for section, options in _event_sections(config).items():
+            name = section[len(EVENT_PREFIX):]
+            try:
+                event, ticks = _compile(name, options)
+            except (KeyError, ValueError) as error:
+                raise ValueError('Invalid event {}: {}'.format(name, error))
+            if isinstance(event, _SpeedLimit):
+                speed_events.extend((tick, event) for tick in ticks)
+            else:
+                for tick in ticks:
+                    self._schedule.setdefault(tick, []).append(event)
+
+        speed_events.sort(key=lambda entry: entry[0])
+        self._limit_ticks = [tick for tick, _ in speed_events]
+        self._limits = [event for _, event in speed_events]
+        self._ticks = sorted(set(self._schedule) | set(self._limit_ticks))
+        logger.debug('Scenario with {} scheduled ticks and {} speed limits'.format(len(self._schedule), len(self._limits)))
+
+    def __len__(self) -> int:
+        return sum(len(events) for events in self._schedule.values()) + len(self._limits)
+
+    def apply(self, config: Config, population: Population, frame: int, rng: np.random.Generator, calendar=None) -> Population:
+        """
+        Apply all events scheduled for frame
+        """
+        for event in self._schedule.get(frame, ()):
+            logger.info('Apply event {}, frame={}'.format(event.name, frame))
+            population = event(config, population, frame, rng, calendar)
+        return population
+
+    def next_event(self, frame: int):
+        """
+        First tick after frame with an event (including speed limits), or None
+        """
+        index = bisect_right(self._ticks, frame)
+        return self._ticks[index] if index < len(self._ticks) else None
+
+    def speed_limit(self, frame: int):
+        """
+        Speed limit event active at frame, or None
+        """
+        index = bisect_right(self._limit_ticks, frame) - 1
+        if index < 0 or self._limits[index].limit is None:
+            return None
+        return self._limits[index]
+
+    def mobile(self, index: np.ndarray, frame: int, citizens: int) -> np.ndarray:
+        """
+        Citizens of flat index (over replicates of citizens) not stopped by an active speed limit of 0
+        """
+        limit = self.speed_limit(frame)
+        if limit is None or limit.limit != 0:
+            return index
+        rows = index % citizens
+        stopped = rows >= (limit.first or 0)
+        if limit.last is not None:
+            stopped &= rows < limit.last
+        return index[~stopped]
+
+    def limit_speed(self, population: Population, frame: int, rows: np.ndarray = None) -> Population:
+        """
+        Cap the speed of the citizens selected by the active speed limit.
+        rows are the indices of the citizens when population is a selection of the world.
+        """
+        limit = self.speed_limit(frame)
+        if limit is None:
+            return population
+        speed = population[..., SPEED]
+        if rows is None:
+            selected = speed[..., limit.group]
+            np.clip(selected, -limit.limit, limit.limit, out=selected)
+        else:
+            mask = rows >= (limit.first or 0)
+            if limit.last is not None:
+                mask &= rows < limit.last
+            speed[mask] = np.clip(speed[mask], -limit.limit, limit.limit)
+        return population
+
+
+class _Event(object):
+    def __init__(self, name: str, options: dict, state: str = None):
+        self.name = name
+        self.first, self.last = _parse_citizens(options.get('citizens'))
+        self.group = slice(self.first, self.last)
+        state = options.get('state', state)
+        self.state = STATES[state.strip().lower()] if state is not None else None
+
+    def _selection(self, population: Population) -> np.ndarray:
+        """
+        State filter over the group, None when all citizens of the group are selected
+        """
+        if self.state is None:
+            return None
+        return population[..., STATE][..., self.group] == self.state
+
+
+class _Send(_Event):
+    def __init__(self, name: str, options: dict, state: str = None):
+        super().__init__(name, options, state)
+        self.targets = np.array(_parse_list(options['destination'], int), dtype=np.uint16)
+        fractions = _parse_list(options['fractions'], float) if 'fractions' in options else [1 / len(self.targets)] * len(self.targets)
+        if len(fractions) != len(self.targets):
+            raise ValueError('one fraction per destination required')
+        edges = np.cumsum(fractions)
+        if np.any(np.asarray(fractions) < 0) or edges[-1] > 1 + 1e-9:
+            raise ValueError('fractions must be positive and sum up to at most 1')
+        if abs(edges[-1] - 1) <= 1e-9:
+            edges[-1] = 1
+        self.edges = edges
+
+    def __call__(self, config, population, frame, rng, calendar):
+        destination = population[..., DESTINATION][..., self.group]
+        arrived = population[..., DESTINATION_ARRIVED][..., self.group]
+        selected = self._selection(population)
+        if len(self.targets) == 1 and self.edges[-1] == 1:
+            target = self.targets[0]
+            if selected is None:
+                selected = True
+        else:
+            # One draw per citizen picks the destination, draws beyond the last edge keep theirs
+            choice = np.searchsorted(self.edges, rng.random(size=destination.shape), side='right')
+            moved = choice < len(self.targets)
+            selected = moved if selected is None else selected & moved
+            target = self.targets[np.minimum(choice, len(self.targets) - 1)]
+        np.copyto(destination, target, where=selected)
+        np.copyto(arrived, 0, where=selected)
+        return population
+
+
+class _SpeedLimit(_Event):
+    def __init__(self, name: str, options: dict):
+        super().__init__(name, options)
+        if self.state is not None:
+            raise ValueError('speed limits select citizens by index only')
+        limit = options['limit'].strip().lower()
+        self.limit = None if limit == 'none' else float(limit)
+
+
+class _Seed(_Event):
+    def __init__(self, name: str, options: dict):
+        super().__init__(name, options, 'healthy')
+        self.count = int(options['count']) if 'count' in options else None
+        self.fraction = float(options.get('fraction', 0))
+
+    def __call__(self, config, population, frame, rng, calendar):
+        state = population[..., STATE][..., self.group]
+        citizens = state.shape[-1]
+        count = self.count if self.count is not None else int(round(self.fraction * citizens))
+        count = min(count, citizens)
+        if count <= 0:
+            return population
+
+        # The count smallest random keys of the selected citizens per replicate
+        keys = rng.random(size=state.shape)
+        keys[~self._selection(population)] = np.inf
+        chosen = np.argpartition(keys, count - 1, axis=-1)[..., :count]
+        valid = np.isfinite(np.take_along_axis(keys, chosen, axis=-1))
+        chosen += self.first or 0
+        if state.ndim > 1:
+            # Flat indices over all replicates
+            chosen += np.arange(state.shape[0])[:, np.newaxis] * population.shape[-2]
+        return infect_citizens(config, population, np.sort(chosen[valid]), frame, rng, calendar)
+
+
+def _event_sections(config: Config) -> dict:
+    """
+    Options of all event sections in one pass, {section: {option: value}}
+    """
+    sections = {}
+    for key, value in config.to_dict().items():
+        section, option = key.split('.', 1)
+        if section.startswith(EVENT_PREFIX):
+            sections.setdefault(section, {})[option] = value
+    return sections
+
+
+def _compile(name: str, options: dict):
+    tick = int(options['tick'])
+    every = int(options.get('every', 0))
+    until = int(options.get('until', tick))
+    ticks = range(tick, until + 1, every) if every > 0 else [tick]
+
+    action = options['action'].strip().lower()
+    if action == ACTION_SEND:
+        event = _Send(name, options)
+    elif action == ACTION_QUARANTINE:
+        event = _Send(name, options, 'sick')
+    elif action == ACTION_SPEED:
+        event = _SpeedLimit(name, options)
+    elif action == ACTION_SEED:
+        event = _Seed(name, options)
+    else:
+        raise ValueError('unknown action {}'.format(action))
+    return event, ticks
+
+
+def _parse_citizens(value):
+    """
+    '<first>-<last>' index range (last included, either may be omitted) to (first, stop)
+    """
+    if value is None:
+        return None, None
+    if '-' not in value:
+        first = int(value)
+        return first, first + 1
+    first, last = value.split('-', 1)
+    return (int(first) if first.strip() else None), (int(last) + 1 if last.strip() else None)
+
+
+def _parse_list(value: str, value_type) -> list:
+    return [value_type(item) for item in value.split(',') if item.strip()]
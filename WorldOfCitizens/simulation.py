@@ -1,81 +1,421 @@
 import os
 import sys
+import json
+import argparse
+import tracemalloc
 import numpy as np
 
 _here = os.path.dirname(__file__)
 sys.path.insert(0, os.path.abspath(os.path.join(_here, '..')))
 from WorldOfCitizens.log import root_logger
 from WorldOfCitizens.config import Config
-from WorldOfCitizens.population import initialize_population, STATE, STATE_DEAD, HEADING_X, HEADING_Y, DESTINATION, DESTINATION_ARRIVED
-from WorldOfCitizens.destination import initialize_destinations, go_to_location, update_heading_to_destination, update_at_destination, stay_at_destination
-from WorldOfCitizens.movement import update_out_of_bounds, update_headings, update_movement
+from WorldOfCitizens.population import Population, ActiveSet, initialize_population, KEYS, SPEED
+from WorldOfCitizens.destination import initialize_destinations, update_destinations
+from WorldOfCitizens.movement import ScratchBuffers, MOVEMENT_KEYS, MOVED_KEYS, update_out_of_bounds, update_headings, update_movement
 from WorldOfCitizens.infection import infect, recover_or_die
+from WorldOfCitizens.progression import DiseaseCalendar
+from WorldOfCitizens.scenario import Scenario
+from WorldOfCitizens.network import ContactNetwork, infect_network, CONTACTS_PROXIMITY, CONTACTS_NETWORK
 from WorldOfCitizens.stat_tracker import StatTracker
-from WorldOfCitizens.visualize import draw_frame
+from WorldOfCitizens.instrumentation import Instrumentation, NULL_INSTRUMENTATION
+from WorldOfCitizens.recorder import TrajectoryRecorder
+from WorldOfCitizens.dashboard import DashboardServer
 
 logger = root_logger
 
+# Below this fraction of moving citizens, only they are gathered and moved
+SUBSET_FRACTION = 0.5
+
+# Ticks per movement step when fast forwarding
+FAST_FORWARD_STEP = 5
+
 
 class Simulation(object):
-    def __init__(self, config: Config):
-        self._population = initialize_population(config)
-        self._destinations = initialize_destinations(config)
-        self._frame = 0
+    def __init__(self, config: Config, seed=None, stat_tracker: StatTracker = None):
+        # All randomness of a simulation comes from its own generator, seed may be an int or a SeedSequence
+        self._rng = np.random.default_rng(seed)
         self._config = config
-        self._stat_tracker = StatTracker()
+        population = self._initialize_population()
+        destinations = initialize_destinations(config)
+        network = None
+        if config.contact_model != CONTACTS_PROXIMITY:
+            network = ContactNetwork.build(config, population, destinations, self._rng)
+        self._setup(population, destinations, 0, stat_tracker or StatTracker(), network=network)
+        self._apply_events()
+
+    def _initialize_population(self):
+        return initialize_population(self._config, self._rng)
+
+    def _setup(self, population: Population, destinations, frame: int, stat_tracker: StatTracker, calendar: DiseaseCalendar = None, network: ContactNetwork = None):
+        config = self._config
+        self._population = population
+        self._destinations = destinations
+        self._frame = frame
+        self._stat_tracker = stat_tracker
+        self._observers = []
+        self._instrumentation = None
+        self._calendar = calendar
+        self._network = network
+        self._scenario = Scenario(config)
+        self._buffers = ScratchBuffers(self._population.shape[:-1])
+        self._subset = None
 
-        self._population[:, DESTINATION] = 1
+        # World boundaries, a bit inside of the world
+        self._xbounds = (config.world_x_bounds[0] + 0.02, config.world_x_bounds[1] - 0.02)
+        self._ybounds = (config.world_y_bounds[0] + 0.02, config.world_y_bounds[1] - 0.02)
 
         logger.setLevel(self.config.log_level)
 
+    def save_checkpoint(self, path: str):
+        """
+        Persist the simulation state into directory path, one .npy file per population column
+        """
+        logger.info('Save checkpoint to {}, frame={}'.format(path, self._frame))
+        os.makedirs(path, exist_ok=True)
+        for key, column in enumerate(self._population.columns):
+            np.save(os.path.join(path, 'population_{}.npy'.format(key)), column)
+        np.save(os.path.join(path, 'destinations.npy'), self._destinations)
+        np.save(os.path.join(path, 'stat_history.npy'), self._stat_tracker.history)
+        if self._calendar is not None:
+            np.savez(os.path.join(path, 'calendar.npz'), **self._calendar.to_arrays())
+        if self._network is not None:
+            self._network.save(os.path.join(path, 'network.npz'))
+
+        metadata = {
+            'frame': self._frame,
+            'rng': self._rng.bit_generator.state,
+            'config': self._config.to_dict(),
+            'stat_tracker': self._stat_tracker.checkpoint()
+        }
+        with open(os.path.join(path, 'checkpoint.json'), 'w') as f:
+            json.dump(metadata, f)
+
+    @classmethod
+    def load_checkpoint(cls, path: str, config: Config = None, seed=None, mmap_mode: str = 'c'):
+        """
+        Restore a simulation saved with save_checkpoint.
+
+        Arrays are memory-mapped, with the default copy-on-write mode ('c') pages are only copied
+        when the simulation changes them, so many scenarios can be forked cheaply from one state.
+        Use 'r' for read-only analysis, None to load into memory. config replaces the saved
+        configuration and seed the saved random state, e.g. for what-if scenarios.
+        """
+        logger.info('Load checkpoint from {}'.format(path))
+        with open(os.path.join(path, 'checkpoint.json')) as f:
+            metadata = json.load(f)
+
+        simulation = cls.__new__(cls)
+        simulation._config = config or Config(overrides=metadata['config'])
+        simulation._rng = np.random.default_rng(seed)
+        if seed is None:
+            simulation._rng.bit_generator.state = metadata['rng']
+
+        population = Population([
+            np.load(os.path.join(path, 'population_{}.npy'.format(key)), mmap_mode=mmap_mode)
+            for key in range(KEYS)
+        ])
+        destinations = np.load(os.path.join(path, 'destinations.npy'), mmap_mode=mmap_mode)
+        stat_tracker = StatTracker.restore(np.load(os.path.join(path, 'stat_history.npy')), metadata['stat_tracker'])
+        calendar = None
+        if os.path.exists(os.path.join(path, 'calendar.npz')):
+            with np.load(os.path.join(path, 'calendar.npz')) as arrays:
+                calendar = DiseaseCalendar.from_arrays(arrays['ticks'], arrays['transitions'], arrays['citizens'])
+        network = None
+        if os.path.exists(os.path.join(path, 'network.npz')):
+            network = ContactNetwork.load(os.path.join(path, 'network.npz'), simulation._config)
+        simulation._setup(population, destinations, metadata['frame'], stat_tracker, calendar, network)
+        return simulation
+
     @property
     def config(self):
         return self._config
 
+    @property
+    def population(self):
+        return self._population
+
+    @property
+    def destinations(self):
+        return self._destinations
+
+    @property
+    def stat_tracker(self):
+        return self._stat_tracker
+
+    @property
+    def frame(self):
+        return self._frame
+
+    def add_observer(self, observer):
+        """
+        Register a callable, which gets called with the simulation after each step
+        """
+        self._observers.append(observer)
+
+    @property
+    def instrumentation(self) -> Instrumentation:
+        return self._instrumentation
+
+    def enable_instrumentation(self, instrumentation: Instrumentation = None) -> Instrumentation:
+        """
+        Time every stage of each tick and count contacts, infections and arrivals
+        """
+        self._instrumentation = instrumentation or Instrumentation()
+        return self._instrumentation
+
+    def disable_instrumentation(self):
+        self._instrumentation = None
+
+    @property
+    def network(self) -> ContactNetwork:
+        """
+        Contact network of households, workplaces and destinations, None with contactModel = proximity
+        """
+        return self._network
+
+    @property
+    def scenario(self) -> Scenario:
+        return self._scenario
+
+    @property
+    def calendar(self) -> DiseaseCalendar:
+        return self._calendar
+
+    def reschedule(self):
+        """
+        Rebuild the disease calendar and active set on the next step, needed after changing STATE,
+        INFECTED_SINCE or RECOVERY_DURATION of sick citizens from outside the simulation during a run
+        """
+        self._calendar = None
+        self._population.active = None
+
+    def run(self, n_ticks: int, fast_forward: bool = False) -> StatTracker:
+        """
+        Simulate n_ticks ticks. With fast_forward, idle phases (nobody sick, no pending transitions)
+        are skipped up to the next scenario event: citizens move in coarse steps of FAST_FORWARD_STEP
+        ticks, the stats are filled in bulk and observers only see the last tick of a jump.
+        """
+        logger.info('Run {} ticks'.format(n_ticks))
+        end = self._frame + n_ticks
+        while self._frame < end:
+            ticks = self._idle_ticks(end) if fast_forward else 0
+            if ticks > 1:
+                self._skip(ticks)
+            else:
+                self.do_step()
+        return self._stat_tracker
+
+    def measure_allocations(self, n_ticks: int = 10) -> float:
+        """
+        Run n_ticks and return the mean peak of memory (bytes) allocated during a tick
+        """
+        peaks = []
+        for _ in range(n_ticks):
+            tracemalloc.start()
+            self.do_step()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        allocations = sum(peaks) / len(peaks)
+        logger.info('Allocations per tick: {:.0f} bytes'.format(allocations))
+        return allocations
+
     def do_step(self):
         logger.debug('Perform step')
+        counters = self._instrumentation
+        instrumentation = counters or NULL_INSTRUMENTATION
+        instrumentation.begin_tick(self._frame)
+        if self._calendar is None:
+            # Built on the first step, so sick citizens set up before the run are included
+            self._calendar = DiseaseCalendar.from_population(self._population, self._frame)
+        if self._population.active is None:
+            self._population.active = self._active_set()
 
-        # Check for destinations in use
-        have_active_destinations = len(self._population[self._population[:, DESTINATION] != 0]) > 0
+        self._move(instrumentation, counters)
+        with instrumentation.stage('infect'):
+            self._infect(counters)
+        with instrumentation.stage('recover'):
+            self._population = recover_or_die(self.config, self._population, self._frame, self._rng, counters, self._calendar)
 
-        if have_active_destinations:
-            self._population = update_at_destination(self._population, self._destinations)
-            self._population = update_heading_to_destination(self._population, self._destinations)
-            self._population = stay_at_destination(self._population, self._destinations)
+        with instrumentation.stage('stats'):
+            self._stat_tracker.update(self.config, self._population)
+        with instrumentation.stage('observers'):
+            for observer in self._observers:
+                observer(self)
 
-        # Check world boundaries
-        xbounds = np.array([[self.config.world_x_bounds[0] + 0.02, self.config.world_x_bounds[1] - 0.02]] * self.config.popuplation_size)
-        ybounds = np.array([[self.config.world_y_bounds[0] + 0.02, self.config.world_y_bounds[1] - 0.02]] * self.config.popuplation_size)
-        self._population = update_out_of_bounds(self._population, xbounds, ybounds)
-        self._population = update_headings(self.config, self._population)
-        self._population = update_movement(self.config, self._population)
-        # self._population = infect(self.config, self._population, self._frame)
-        # self._population = recover_or_die(self.config, self._population, self._frame)
+        instrumentation.end_tick()
+
+        self._frame += 1
+        self._apply_events()
+
+    def _active_set(self) -> ActiveSet:
+        return ActiveSet(self._population)
 
-        # Deads cannot move anymore
-        self._population[:, HEADING_X][self._population[:, STATE] == STATE_DEAD] = 0
-        self._population[:, HEADING_Y][self._population[:, STATE] == STATE_DEAD] = 0
+    def _idle_ticks(self, end: int) -> int:
+        """
+        Ticks until end or the next event in which the epidemic cannot change, 0 when it can
+        """
+        active = self._population.active
+        if self._calendar is None or active is None or len(self._calendar) > 0 or len(active.infectious) > 0:
+            return 0
+        next_event = self._scenario.next_event(self._frame)
+        return (end if next_event is None else min(end, next_event)) - self._frame
 
-        self._stat_tracker.update(self.config, self._population)
-        draw_frame(self.config, self._population, self._destinations, self._stat_tracker, self._frame)
+    def _skip(self, ticks: int):
+        """
+        Advance ticks idle ticks at once
+        """
+        logger.debug('Fast forward {} ticks from frame {}'.format(ticks, self._frame))
+        counters = self._instrumentation
+        instrumentation = counters or NULL_INSTRUMENTATION
+        instrumentation.begin_tick(self._frame)
+        first = self._frame
+        for frame in range(first, first + ticks, FAST_FORWARD_STEP):
+            self._frame = frame
+            self._move(instrumentation, counters, min(FAST_FORWARD_STEP, first + ticks - frame))
+        self._frame = first + ticks - 1
+
+        with instrumentation.stage('stats'):
+            self._stat_tracker.extend(self.config, self._population, ticks)
+        with instrumentation.stage('observers'):
+            for observer in self._observers:
+                observer(self)
+        instrumentation.end_tick()
 
         self._frame += 1
-        if self._frame == 60:
-            update = np.random.random(size=(self._config.popuplation_size))
-            shp = update[update < 0.5].shape
-            self._population[:, DESTINATION][update < 0.5] = 2
-            self._population[:, DESTINATION_ARRIVED][update < 0.5] = 0
+        self._apply_events()
 
-            self._population[:, DESTINATION][update >= 0.5] = 3
-            self._population[:, DESTINATION_ARRIVED][update > 0.5] = 0
+    def _move(self, instrumentation, counters, ticks: int = 1):
+        active = self._population.active
+        moving = self._scenario.mobile(active.mobile, self._frame, self._population.shape[-2])
+        if len(moving) >= SUBSET_FRACTION * active.size:
+            # Most citizens move, all are processed and the stopped ones kept in place
+            self._move_citizens(self._population, self._buffers, None, active.dead, instrumentation, counters, ticks)
+            return
 
+        # Only the moving citizens, gathered into a compact population and written back
+        with instrumentation.stage('gather'):
+            if self._subset is None:
+                self._subset = (Population.zeros((active.size,)), ScratchBuffers((active.size,)))
+            citizens = self._population.take(moving, MOVEMENT_KEYS, self._subset[0].head(len(moving)))
+            buffers = self._subset[1].head(len(moving))
+        rows = moving if self._population.ndim == 2 else moving % self._population.shape[-2]
+        self._move_citizens(citizens, buffers, rows, None, instrumentation, counters, ticks)
+        with instrumentation.stage('scatter'):
+            self._population.put(moving, citizens, MOVED_KEYS)
 
-if __name__ == '__main__':
-    config = Config('woc-config.ini')
+    def _move_citizens(self, population, buffers, rows, stopped, instrumentation, counters, ticks):
+        """
+        Movement stages over population for ticks ticks, rows are the citizen indices of a gathered
+        population, stopped citizens (flat indices) get no speed
+        """
+        with instrumentation.stage('destinations'):
+            population = update_destinations(population, self._destinations, self._rng, buffers, counters, self._config.backend)
+
+        # Check world boundaries
+        with instrumentation.stage('bounds'):
+            population = update_out_of_bounds(population, self._xbounds, self._ybounds, self._rng, buffers, backend=self._config.backend)
+        with instrumentation.stage('headings'):
+            population = update_headings(self.config, population, self._rng, buffers, ticks)
+            population = self._scenario.limit_speed(population, self._frame, rows)
+            if stopped is not None and len(stopped) > 0:
+                population[..., SPEED].reshape(-1)[stopped] = 0
+        with instrumentation.stage('movement'):
+            update_movement(self.config, population, buffers, ticks)
+
+    def _infect(self, counters):
+        # Citizens infected in this tick infect others from the next tick on, in both contact models
+        sources = self._population.active.infectious
+        if self._config.contact_model != CONTACTS_NETWORK:
+            self._population = infect(self.config, self._population, self._frame, self._rng, counters, self._calendar, sources)
+        self._infect_network(counters, sources)
 
-    simulation = Simulation(config)
-    for step in range(1000):
-        simulation.do_step()
+    def _infect_network(self, counters, sources: np.ndarray):
+        if self._network is not None:
+            self._population = infect_network(self.config, self._population, self._network, self._frame, self._rng, counters, self._calendar, sources)
 
-    while (True):
-        pass
+    def _apply_events(self):
+        self._population = self._scenario.apply(self.config, self._population, self._frame, self._rng, self._calendar)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate the spread of an infection in a world of citizens')
+    parser.add_argument('--config', default='woc-config.ini', help='configuration file')
+    parser.add_argument('--ticks', type=int, default=1000, help='number of ticks to simulate (at least 1)')
+    parser.add_argument('--headless', action='store_true', help='run without visualization')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random generator')
+    parser.add_argument('--timeline', default=None, help='write per stage timings and counters to this CSV/JSON file')
+    parser.add_argument('--stats', default=None, help='stream the stats of every tick to this CSV file')
+    parser.add_argument('--max-history', type=int, default=None, help='number of ticks of stats kept in memory (at least 1)')
+    parser.add_argument('--record', default=None, help='record the trajectories to this directory')
+    parser.add_argument('--record-every', type=int, default=1, help='record every n-th tick')
+    parser.add_argument('--record-chunk-ticks', type=int, default=100, help='recorded ticks per chunk (chunks hold at most 32 MiB of positions)')
+    parser.add_argument('--render', default=None, help='render to this .mp4 or .gif file or PNG directory in the background')
+    parser.add_argument('--render-every', type=int, default=1, help='render every n-th tick')
+    parser.add_argument('--dashboard', type=int, default=None, help='publish stats on this local TCP port')
+    parser.add_argument('--fast-forward', action='store_true', help='skip ticks without sick citizens in coarse steps')
+    parser.add_argument('--tiles', type=int, nargs=2, default=None, metavar=('COLUMNS', 'ROWS'), help='split the world into tiles simulated by worker processes')
+    args = parser.parse_args(argv)
+    if args.ticks < 1:
+        parser.error('--ticks must be at least 1')
+    if args.max_history is not None and args.max_history < 1:
+        parser.error('--max-history must be at least 1')
+
+    config = Config(args.config)
+    stat_tracker = StatTracker(max_history=args.max_history, stream=args.stats)
+    if args.tiles is not None:
+        from WorldOfCitizens.domain import DomainSimulation
+        simulation = DomainSimulation(config, tiles=tuple(args.tiles), seed=args.seed, stat_tracker=stat_tracker)
+    else:
+        simulation = Simulation(config, seed=args.seed, stat_tracker=stat_tracker)
+    if args.timeline is not None:
+        simulation.enable_instrumentation()
+
+    recorder = None
+    if args.record is not None:
+        recorder = TrajectoryRecorder(args.record, chunk_ticks=args.record_chunk_ticks, every=args.record_every)
+        simulation.add_observer(recorder)
+
+    render_worker = None
+    if args.render is not None:
+        from WorldOfCitizens.renderer import RenderWorker
+        render_worker = RenderWorker(config, args.render, every=args.render_every, ticks=args.ticks)
+        simulation.add_observer(render_worker)
+
+    dashboard = None
+    if args.dashboard is not None:
+        dashboard = DashboardServer(port=args.dashboard).start()
+        simulation.add_observer(dashboard)
+
+    visualizer = None
+    if not args.headless:
+        # Import on demand, headless runs must not depend on a display
+        from WorldOfCitizens.visualize import Visualizer
+        visualizer = Visualizer(config, ticks=args.ticks)
+        simulation.add_observer(visualizer)
+
+    simulation.run(args.ticks, fast_forward=args.fast_forward)
+    if args.tiles is not None:
+        simulation.close()
+    stat_tracker.close()
+    if recorder is not None:
+        recorder.close()
+    if render_worker is not None:
+        render_worker.close()
+    if dashboard is not None:
+        dashboard.close()
+    print('susceptible={} infectious={} recovered={} fatalities={}'.format(
+        stat_tracker.susceptible[-1],
+        stat_tracker.infectious[-1],
+        stat_tracker.recovered[-1],
+        stat_tracker.fatalities[-1]
+    ))
+
+    if args.timeline is not None:
+        simulation.instrumentation.export(args.timeline)
+
+    if visualizer is not None:
+        visualizer.show()
+
+
+if __name__ == '__main__':
+    main()
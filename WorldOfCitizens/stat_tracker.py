@@ -1,34 +1,287 @@
 import numpy as np
 from WorldOfCitizens.config import Config
-from WorldOfCitizens.population import STATE, STATE_SICK, STATE_IMMUNE, STATE_DEAD, STATE_HEALTHY
+from WorldOfCitizens.population import Population, STATE, STATE_SICK, STATE_IMMUNE, STATE_DEAD, STATE_HEALTHY, N_STATES
+
+
+# History columns
+SUSCEPTIBLE = 0
+INFECTIOUS = 1
+RECOVERED = 2
+FATALITIES = 3
+NEW_INFECTIONS = 4
+COLUMNS = ['susceptible', 'infectious', 'recovered', 'fatalities', 'new_infections']
 
 
 class StatTracker(object):
-    def __init__(self):
-        # Initialize the counters
-        self._susceptible = []
-        self._infectious = []
-        self._recovered = []
-        self._fatalities = []
+    """
+    Counts of citizens per state and tick.
+
+    All counts of a tick come from a single bincount over the STATE column. The history is kept
+    in a growable NumPy buffer; with max_history only the latest ticks are kept in memory and
+    stream (a CSV file name) receives every record, so memory stays bounded for long runs.
+    Batched populations (replicates, citizens) record one count per replicate.
+    """
+
+    def __init__(self, max_history: int = None, stream: str = None, flush_every: int = 1024):
+        if max_history is not None and max_history < 1:
+            raise ValueError('max_history must be at least 1')
+        self._max_history = max_history
+        self._history = None
+        self._length = 0
+        self._ticks = 0
+
+        self._previous_susceptible = None
+        self._peak_infectious = None
+        self._peak_tick = None
+        self._mean_recovery_duration = None
+
+        self._stream_name = stream
+        self._stream = None
+        self._flush_every = flush_every
+        self._pending = []
+
+    @property
+    def history(self) -> np.ndarray:
+        """
+        Retained records, shape (ticks, [replicates,] columns)
+        """
+        if self._history is None:
+            return np.zeros((0, len(COLUMNS)), dtype=np.int64)
+        start = 0 if self._max_history is None else max(0, self._length - self._max_history)
+        return self._history[start:self._length]
+
+    @property
+    def ticks(self) -> int:
+        return self._ticks
+
+    @property
+    def first_tick(self) -> int:
+        """
+        Tick of the first retained record
+        """
+        return self._ticks - len(self.history)
 
     @property
     def susceptible(self):
-        return self._susceptible
+        return self.history[..., SUSCEPTIBLE]
 
     @property
     def infectious(self):
-        return self._infectious
+        return self.history[..., INFECTIOUS]
 
     @property
     def recovered(self):
-        return self._recovered
+        return self.history[..., RECOVERED]
 
     @property
     def fatalities(self):
-        return self._fatalities
+        return self.history[..., FATALITIES]
+
+    @property
+    def new_infections(self):
+        return self.history[..., NEW_INFECTIONS]
+
+    @property
+    def peak_infectious(self):
+        return None if self._peak_infectious is None else self._peak_infectious[()]
+
+    @property
+    def time_to_peak(self):
+        """
+        Tick of the infectious peak
+        """
+        return None if self._peak_tick is None else self._peak_tick[()]
+
+    def r_t(self, window: int = 7) -> np.ndarray:
+        """
+        Effective reproduction number per retained tick: new infections per infectious citizen
+        over a sliding window, times the mean recovery duration. NaN without infectious citizens.
+        """
+        history = self.history
+        if self._mean_recovery_duration is None:
+            # Nothing recorded yet
+            return np.zeros(history.shape[:-1])
+        new_infections = np.cumsum(history[..., NEW_INFECTIONS], axis=0, dtype=np.float64)
+        infectious = np.cumsum(history[..., INFECTIOUS], axis=0, dtype=np.float64)
+        new_infections[window:] = new_infections[window:] - new_infections[:-window]
+        infectious[window:] = infectious[window:] - infectious[:-window]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(infectious > 0, new_infections / infectious * self._mean_recovery_duration, np.nan)
+
+    def update(self, config: Config, population: Population):
+        if self._mean_recovery_duration is None:
+            self._mean_recovery_duration = sum(config.recovery_duration) / 2
+
+        state = population[..., STATE]
+        if state.ndim == 1:
+            counts = np.bincount(state, minlength=N_STATES)
+        else:
+            # Offset the states of every replicate, one bincount for all of them
+            replicates = state.shape[0]
+            offsets = (np.arange(replicates) * N_STATES)[:, np.newaxis]
+            counts = np.bincount((state + offsets).ravel(), minlength=replicates * N_STATES).reshape(replicates, N_STATES)
+
+        record = np.empty(counts.shape[:-1] + (len(COLUMNS),), dtype=np.int64)
+        record[..., SUSCEPTIBLE] = counts[..., STATE_HEALTHY]
+        record[..., INFECTIOUS] = counts[..., STATE_SICK]
+        record[..., RECOVERED] = counts[..., STATE_IMMUNE]
+        record[..., FATALITIES] = counts[..., STATE_DEAD]
+        if self._previous_susceptible is None:
+            record[..., NEW_INFECTIONS] = 0
+        else:
+            record[..., NEW_INFECTIONS] = self._previous_susceptible - record[..., SUSCEPTIBLE]
+        self._previous_susceptible = record[..., SUSCEPTIBLE].copy()
+
+        self._track_peak(record[..., INFECTIOUS])
+        self._append(record)
+
+    def extend(self, config: Config, population: Population, ticks: int):
+        """
+        Record the current counts for ticks ticks at once, for ticks in which no state changes
+        """
+        if ticks <= 0:
+            return
+        self.update(config, population)
+        record = self._history[self._length - 1].copy()
+        record[..., NEW_INFECTIONS] = 0
+        self._append_many(record, ticks - 1)
+
+    def checkpoint(self) -> dict:
+        """
+        Tracker state besides the history, JSON serializable
+        """
+        def to_list(value):
+            return None if value is None else value.tolist()
+
+        return {
+            'ticks': self._ticks,
+            'max_history': self._max_history,
+            'previous_susceptible': to_list(self._previous_susceptible),
+            'peak_infectious': to_list(self._peak_infectious),
+            'peak_tick': to_list(self._peak_tick),
+            'mean_recovery_duration': self._mean_recovery_duration
+        }
+
+    @classmethod
+    def restore(cls, history: np.ndarray, state: dict, stream: str = None):
+        """
+        Tracker continuing from a history and a checkpoint() state
+        """
+        def to_array(value):
+            return None if value is None else np.array(value)
+
+        stat_tracker = cls(max_history=state['max_history'], stream=stream)
+        if len(history) > 0:
+            capacity = max(1024, 2 * len(history)) if state['max_history'] is None else 2 * state['max_history']
+            stat_tracker._history = np.zeros((capacity,) + history.shape[1:], dtype=np.int64)
+            stat_tracker._history[:len(history)] = history
+            stat_tracker._length = len(history)
+        stat_tracker._ticks = state['ticks']
+        stat_tracker._previous_susceptible = to_array(state['previous_susceptible'])
+        stat_tracker._peak_infectious = to_array(state['peak_infectious'])
+        stat_tracker._peak_tick = to_array(state['peak_tick'])
+        stat_tracker._mean_recovery_duration = state['mean_recovery_duration']
+        return stat_tracker
+
+    def flush(self):
+        """
+        Write pending records to the stream
+        """
+        if not self._pending:
+            return
+        ticks = np.array([tick for tick, _ in self._pending])
+        records = np.stack([record for _, record in self._pending])
+        self._pending = []
+
+        if self._stream is None:
+            self._stream = open(self._stream_name, 'w')
+            replicate = 'replicate,' if records.ndim > 2 else ''
+            self._stream.write('tick,{}{}\n'.format(replicate, ','.join(COLUMNS)))
+
+        if records.ndim > 2:
+            replicates = records.shape[1]
+            rows = np.column_stack([
+                np.repeat(ticks, replicates),
+                np.tile(np.arange(replicates), len(ticks)),
+                records.reshape(-1, len(COLUMNS))
+            ])
+        else:
+            rows = np.column_stack([ticks, records])
+        np.savetxt(self._stream, rows, fmt='%d', delimiter=',')
+        self._stream.flush()
+
+    def close(self):
+        self.flush()
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    @staticmethod
+    def read_stream(filename: str) -> np.ndarray:
+        """
+        Records of a stream file as structured array, fields tick, [replicate,] and the columns
+        """
+        return np.genfromtxt(filename, delimiter=',', names=True, dtype=np.int64)
+
+    def _track_peak(self, infectious):
+        if self._peak_infectious is None:
+            self._peak_infectious = np.array(infectious)
+            self._peak_tick = np.zeros_like(self._peak_infectious)
+            return
+        higher = infectious > self._peak_infectious
+        self._peak_infectious = np.where(higher, infectious, self._peak_infectious)
+        self._peak_tick = np.where(higher, self._ticks, self._peak_tick)
+
+    def _append(self, record):
+        if self._history is None:
+            capacity = 1024 if self._max_history is None else 2 * self._max_history
+            self._history = np.zeros((capacity,) + record.shape, dtype=np.int64)
+        if self._length == len(self._history):
+            if self._max_history is None:
+                self._history = np.concatenate([self._history, np.zeros_like(self._history)])
+            else:
+                # Move the window to the front, amortized O(1) per tick
+                keep = self._max_history - 1
+                self._history[:keep] = self._history[self._length - keep:self._length]
+                self._length = keep
+        self._history[self._length] = record
+        self._length += 1
+
+        if self._stream_name is not None:
+            self._pending.append((self._ticks, record))
+            if len(self._pending) >= self._flush_every:
+                self.flush()
+        self._ticks += 1
+
+    def _append_many(self, record, count: int):
+        """
+        Append count copies of record
+        """
+        if count <= 0:
+            return
+        if self._max_history is None:
+            end = self._length + count
+            if end > len(self._history):
+                capacity = len(self._history)
+                while capacity < end:
+                    capacity *= 2
+                history = np.zeros((capacity,) + record.shape, dtype=np.int64)
+                history[:self._length] = self._history[:self._length]
+                self._history = history
+        else:
+            # Only the latest max_history records are retained
+            retained = min(count, self._max_history)
+            if self._length + retained > len(self._history):
+                keep = min(self._length, self._max_history - retained)
+                self._history[:keep] = self._history[self._length - keep:self._length]
+                self._length = keep
+            end = self._length + retained
+        self._history[self._length:end] = record
+        self._length = end
 
-    def update(self, config: Config, population: np.ndarray):
-        self._susceptible.append(len(population[population[:, STATE] == STATE_HEALTHY]))
-        self._infectious.append(len(population[population[:, STATE] == STATE_SICK]))
-        self._recovered.append(len(population[population[:, STATE] == STATE_IMMUNE]))
-        self._fatalities.append(len(population[population[:, STATE] == STATE_DEAD]))
+        if self._stream_name is not None:
+            for tick in range(self._ticks, self._ticks + count):
+                self._pending.append((tick, record))
+                if len(self._pending) >= self._flush_every:
+                    self.flush()
+        self._ticks += count
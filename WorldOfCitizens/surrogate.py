@@ -0,0 +1,154 @@
+import numpy as np
+from WorldOfCitizens.log import root_logger
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.stat_tracker import StatTracker, COLUMNS, SUSCEPTIBLE, INFECTIOUS, RECOVERED, FATALITIES, NEW_INFECTIONS
+from WorldOfCitizens.batch import BatchSimulation
+from WorldOfCitizens.ensemble import parameter_grid
+
+
+logger = root_logger.getChild('surrogate')
+
+
+class MeanFieldModel(object):
+    """
+    Compartmental (susceptible, infectious, recovered, dead) model of the agent simulation,
+    integrated in ticks for many parameter sets (configs) at once.
+
+    A susceptible citizen meets the infectious citizens within the infection zone of a uniformly
+    mixed world, (2 * infectionRange)^2 / world area * infectious contacts per tick, times the
+    contact_factor, and gets infected with 1 - (1 - infectionPropability)^contacts. Infected
+    citizens stay infectious for a duration drawn like in the agent model and then die with
+    mortalityChance. contact_factor accounts for crowding (e.g. at destinations), fit it with calibrate().
+    """
+
+    def __init__(self, configs, contact_factor=1.0):
+        if isinstance(configs, Config):
+            configs = [configs]
+        self._single = len(configs) == 1
+        self._population = np.array([config.popuplation_size for config in configs], dtype=np.float64)
+        self._probability = np.array([config.infection_probability for config in configs])
+        self._mortality = np.array([config.mortality_chance for config in configs])
+        zone = np.array([(2 * config.infection_range) ** 2 for config in configs])
+        area = np.array([
+            (config.world_x_bounds[1] - config.world_x_bounds[0]) * (config.world_y_bounds[1] - config.world_y_bounds[0])
+            for config in configs
+        ], dtype=np.float64)
+        self._contacts = zone / area * contact_factor
+        self._durations = _duration_distribution([config.recovery_duration for config in configs])
+        self._mean_recovery_duration = np.array([sum(config.recovery_duration) / 2 for config in configs])
+
+    def __len__(self) -> int:
+        return len(self._population)
+
+    def integrate(self, n_ticks: int, initial_infectious=1) -> np.ndarray:
+        """
+        Expected counts per tick, shape (ticks, parameter sets, columns) like a batched StatTracker history
+        """
+        population = self._population
+        with np.errstate(divide='ignore'):
+            # -inf for a probability of 1
+            log_escape = np.log1p(-self._probability)
+        infected = np.zeros((n_ticks, len(self)))
+        history = np.zeros((n_ticks, len(self), len(COLUMNS)))
+
+        infectious = np.broadcast_to(np.asarray(initial_infectious, dtype=np.float64), population.shape).copy()
+        susceptible = population - infectious
+        recovered = np.zeros_like(population)
+        dead = np.zeros_like(population)
+        if n_ticks > 0:
+            infected[0] = infectious
+        for tick in range(n_ticks):
+            # Without infectious contacts nobody is infected, 0 * -inf would be NaN
+            pressure = infectious * self._contacts
+            exponent = np.multiply(pressure, log_escape, out=np.zeros_like(pressure), where=pressure > 0)
+            new = susceptible * -np.expm1(exponent)
+            susceptible -= new
+            infectious += new
+            infected[tick] += new
+
+            # Citizens infected d ticks ago with a duration of d + 1 recover or die now
+            window = infected[max(0, tick - len(self._durations) + 1):tick + 1][::-1]
+            resolved = np.einsum('dk,dk->k', window, self._durations[:len(window)])
+            infectious -= resolved
+            dead += resolved * self._mortality
+            recovered += resolved * (1 - self._mortality)
+
+            history[tick, :, SUSCEPTIBLE] = susceptible
+            history[tick, :, INFECTIOUS] = infectious
+            history[tick, :, RECOVERED] = recovered
+            history[tick, :, FATALITIES] = dead
+        return history
+
+    def run(self, n_ticks: int, initial_infectious=1) -> StatTracker:
+        """
+        Counts per tick rounded to citizens as StatTracker, with the parameter sets in place of the
+        replicates of a batched simulation (single config: the shape of a Simulation)
+        """
+        history = np.rint(self.integrate(n_ticks, initial_infectious)).astype(np.int64)
+        history[1:, :, NEW_INFECTIONS] = history[:-1, :, SUSCEPTIBLE] - history[1:, :, SUSCEPTIBLE]
+        mean_recovery_duration = self._mean_recovery_duration
+        if self._single:
+            history = history[:, 0]
+            mean_recovery_duration = float(mean_recovery_duration[0])
+
+        infectious = history[..., INFECTIOUS]
+        return StatTracker.restore(history, {
+            'ticks': len(history),
+            'max_history': None,
+            'previous_susceptible': history[-1, ..., SUSCEPTIBLE].tolist() if len(history) > 0 else None,
+            'peak_infectious': infectious.max(axis=0).tolist() if len(history) > 0 else None,
+            'peak_tick': infectious.argmax(axis=0).tolist() if len(history) > 0 else None,
+            'mean_recovery_duration': mean_recovery_duration
+        })
+
+
+def run_surrogate(config: Config, grid: dict = None, n_ticks: int = 100, contact_factor: float = 1.0, initial_infectious=1) -> StatTracker:
+    """
+    Mean-field curves for every point of grid ({'section.option': [values]}), in the order of
+    parameter_grid(grid), as one StatTracker with the points in place of replicates.
+    Without grid, the curves of config with the shape of a Simulation.
+    """
+    points = parameter_grid(grid or {})
+    logger.info('Run surrogate, points={} ticks={}'.format(len(points), n_ticks))
+    configs = [config.override(overrides) for overrides in points]
+    return MeanFieldModel(configs, contact_factor).run(n_ticks, initial_infectious)
+
+
+def calibrate(config: Config, n_ticks: int = 100, replicates: int = 8, initial_infectious: int = 5, seed=None, rounds: int = 3) -> float:
+    """
+    Fit the contact_factor of the mean-field model to short agent runs of config: replicates
+    lockstep runs of n_ticks seeded with initial_infectious sick citizens, the squared error of
+    the mean cumulative infections is minimized by refining a grid of factors rounds times
+    """
+    seeded = config.override({
+        'event:calibration.tick': 0,
+        'event:calibration.action': 'seed',
+        'event:calibration.count': initial_infectious
+    })
+    simulation = BatchSimulation(seeded, replicates, seed=seed)
+    simulation.run(n_ticks)
+    target = config.popuplation_size - simulation.curves('susceptible').mean(axis=0)
+
+    factors = np.geomspace(1e-2, 1e4, 121)
+    for _ in range(rounds):
+        model = MeanFieldModel([config] * len(factors), contact_factor=factors)
+        infected = config.popuplation_size - model.integrate(n_ticks, initial_infectious)[:, :, SUSCEPTIBLE]
+        error = np.mean((infected - target[:, np.newaxis]) ** 2, axis=0)
+        best = int(np.argmin(error))
+        factors = np.geomspace(factors[max(best - 1, 0)], factors[min(best + 1, len(factors) - 1)], 41)
+    factor = float(factors[len(factors) // 2])
+    logger.info('Calibrated contact factor {:.4g}, error={:.4g}'.format(factor, error[best]))
+    return factor
+
+
+def _duration_distribution(recovery_durations: list) -> np.ndarray:
+    """
+    Probability of an infection to last d + 1 ticks, shape (durations, parameter sets). Durations are
+    uniform integers in [from, to) as drawn by the agent model, a duration of 0 ends in the first tick.
+    """
+    longest = max(max(high, low + 1) for low, high in recovery_durations)
+    distribution = np.zeros((max(longest, 1), len(recovery_durations)))
+    for index, (low, high) in enumerate(recovery_durations):
+        durations = np.arange(low, max(high, low + 1))
+        np.add.at(distribution[:, index], np.maximum(durations, 1) - 1, 1 / len(durations))
+    return distribution
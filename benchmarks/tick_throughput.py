@@ -0,0 +1,122 @@
+"""
+Tick throughput benchmark.
+
+Times Simulation.do_step and each of its stages (from the instrumentation timeline of the
+measured ticks) for several population sizes, headless and with fixed seeds, and writes
+the results as JSON.
+
+    python benchmarks/tick_throughput.py --sizes 100 10000 100000 1000000 --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import numpy as np
+
+_here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_here, '..')))
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.simulation import Simulation
+from WorldOfCitizens.population import STATE, STATE_SICK, INFECTED_SINCE, RECOVERY_DURATION
+from WorldOfCitizens.kernels import effective_backend
+
+
+DEFAULT_SIZES = [100, 10000, 100000, 1000000]
+
+# Share of citizens infected before measuring, so infection stages have work to do
+INITIAL_SICK = 0.01
+
+
+def benchmark(config_file: str, size: int, repeats: int, warmup: int, seed: int) -> dict:
+    """
+    Times of repeats ticks of Simulation.do_step, and of each stage from the instrumentation
+    timeline of the same ticks, so every stage is measured on the state of a real tick
+    """
+    config = Config(config_file, overrides={'simulation.populationSize': size})
+    simulation = Simulation(config, seed=seed)
+    infect_initial(simulation, np.random.default_rng(seed))
+    simulation.run(warmup)
+
+    instrumentation = simulation.enable_instrumentation()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        simulation.do_step()
+        timings.append(time.perf_counter() - start)
+    simulation.disable_instrumentation()
+
+    results = {'do_step': _summary(timings)}
+    timeline = instrumentation.timeline
+    for name in _stage_names(timeline):
+        results[name] = _summary([record[name] for record in timeline if name in record])
+    return results
+
+
+def infect_initial(simulation: Simulation, rng: np.random.Generator):
+    """
+    Infect INITIAL_SICK of the citizens as if they got sick during the last recovery duration,
+    so outcomes are due in every measured tick
+    """
+    config = simulation.config
+    population = simulation.population
+    sick = np.flatnonzero(rng.random(len(population)) < INITIAL_SICK)
+    low, high = config.recovery_duration
+    duration = np.maximum(rng.integers(low, max(high, low + 1), size=len(sick)), 1)
+    population[sick, STATE] = STATE_SICK
+    population[sick, RECOVERY_DURATION] = duration
+    population[sick, INFECTED_SINCE] = simulation.frame - rng.integers(0, duration)
+    simulation.reschedule()
+
+
+def _stage_names(timeline: list) -> list:
+    # Stage timers are floats, counters are integers
+    names = []
+    for record in timeline:
+        names.extend(name for name, value in record.items() if isinstance(value, float) and name != 'tick' and name not in names)
+    return names
+
+
+def _summary(timings: list) -> dict:
+    return {
+        'min': min(timings),
+        'median': float(np.median(timings)),
+        'mean': float(np.mean(timings)),
+        'repeats': len(timings)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark tick throughput across population sizes')
+    parser.add_argument('--config', default='woc-config.ini', help='configuration file')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='population sizes')
+    parser.add_argument('--repeats', type=int, default=10, help='measured ticks')
+    parser.add_argument('--warmup', type=int, default=5, help='ticks before measuring')
+    parser.add_argument('--seed', type=int, default=42, help='seed of the random generator')
+    parser.add_argument('--output', default=None, help='JSON result file')
+    args = parser.parse_args(argv)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'seed': args.seed,
+        'results': {}
+    }
+    for size in args.sizes:
+        report['results'][str(size)] = benchmark(args.config, size, args.repeats, args.warmup, args.seed)
+        report['backend'] = effective_backend(Config(args.config).backend)
+
+        print('populationSize={}'.format(size))
+        for name, timing in report['results'][str(size)].items():
+            print('  {:<22} {:10.3f} ms'.format(name, timing['median'] * 1000))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import os
+import numpy as np
+import pytest
+
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.simulation import Simulation
+from WorldOfCitizens.batch import BatchSimulation
+from WorldOfCitizens.contact import find_contacts
+from WorldOfCitizens.kernels import BACKEND_NUMPY, BACKEND_NUMBA
+
+pytest.importorskip('numba')
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'woc-config.ini')
+SEEDED = {
+    'simulation.populationSize': 500,
+    'event:patientZero.tick': 0,
+    'event:patientZero.action': 'seed',
+    'event:patientZero.count': 10
+}
+
+
+def _config(backend):
+    overrides = dict(SEEDED)
+    overrides['simulation.backend'] = backend
+    return Config(CONFIG_FILE, overrides)
+
+
+def _assert_same_run(numpy_simulation, numba_simulation, n_ticks):
+    numpy_simulation.run(n_ticks)
+    numba_simulation.run(n_ticks)
+    np.testing.assert_array_equal(numpy_simulation.stat_tracker.history, numba_simulation.stat_tracker.history)
+    for numpy_column, numba_column in zip(numpy_simulation.population.columns, numba_simulation.population.columns):
+        np.testing.assert_array_equal(numpy_column, numba_column)
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_contacts(dtype):
+    rng = np.random.default_rng(1)
+    sources = rng.uniform(-0.1, 1.1, size=(2, 300)).astype(dtype)
+    targets = rng.uniform(-0.1, 1.1, size=(2, 2000)).astype(dtype)
+    source_groups = rng.integers(0, 3, size=300)
+    target_groups = rng.integers(0, 3, size=2000)
+
+    for groups in ((None, None), (source_groups, target_groups)):
+        expected = find_contacts(sources[0], sources[1], targets[0], targets[1], 0.05, *groups, backend=BACKEND_NUMPY)
+        actual = find_contacts(sources[0], sources[1], targets[0], targets[1], 0.05, *groups, backend=BACKEND_NUMBA)
+        np.testing.assert_array_equal(expected[0], actual[0])
+        np.testing.assert_array_equal(expected[1], actual[1])
+
+
+def test_simulation():
+    _assert_same_run(Simulation(_config(BACKEND_NUMPY), seed=7), Simulation(_config(BACKEND_NUMBA), seed=7), 100)
+
+
+def test_batch_simulation():
+    _assert_same_run(BatchSimulation(_config(BACKEND_NUMPY), 3, seed=7), BatchSimulation(_config(BACKEND_NUMBA), 3, seed=7), 100)
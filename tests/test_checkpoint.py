@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import pytest
+
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.simulation import Simulation
+from WorldOfCitizens.batch import BatchSimulation
+from WorldOfCitizens.stat_tracker import SUSCEPTIBLE
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'woc-config.ini')
+SIMULATIONS = {
+    'simulation': lambda config: Simulation(config, seed=11),
+    'batch': lambda config: BatchSimulation(config, 3, seed=11)
+}
+
+
+def _config(contact_model):
+    return Config(CONFIG_FILE, {
+        'simulation.populationSize': 300,
+        'infection.contactModel': contact_model,
+        'event:patientZero.tick': 0,
+        'event:patientZero.action': 'seed',
+        'event:patientZero.count': 5
+    })
+
+
+@pytest.mark.parametrize('contact_model', ['proximity', 'both'])
+@pytest.mark.parametrize('kind', sorted(SIMULATIONS))
+@pytest.mark.parametrize('mmap_mode', ['c', None])
+def test_restore_continues_identically(tmp_path, kind, contact_model, mmap_mode):
+    if contact_model != 'proximity':
+        pytest.importorskip('scipy')
+    config = _config(contact_model)
+    uninterrupted = SIMULATIONS[kind](config)
+    uninterrupted.run(50)
+
+    interrupted = SIMULATIONS[kind](config)
+    interrupted.run(20)
+    interrupted.save_checkpoint(str(tmp_path))
+    restored = type(interrupted).load_checkpoint(str(tmp_path), mmap_mode=mmap_mode)
+    assert restored.frame == 20
+    restored.run(30)
+
+    assert restored.frame == uninterrupted.frame
+    for restored_column, column in zip(restored.population.columns, uninterrupted.population.columns):
+        np.testing.assert_array_equal(restored_column, column)
+    np.testing.assert_array_equal(restored.stat_tracker.history, uninterrupted.stat_tracker.history)
+    assert restored.stat_tracker.checkpoint() == uninterrupted.stat_tracker.checkpoint()
+    # The epidemic goes on after the checkpoint
+    assert restored.stat_tracker.history[-1, ..., SUSCEPTIBLE].sum() < interrupted.stat_tracker.history[-1, ..., SUSCEPTIBLE].sum()
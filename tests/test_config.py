@@ -0,0 +1,23 @@
+import os
+import pytest
+
+from WorldOfCitizens.config import Config
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'woc-config.ini')
+
+
+def test_recovery_duration_fits_the_column():
+    assert Config(CONFIG_FILE, {'infection.recoveryDurationTo': 32767}).recovery_duration[1] == 32767
+    with pytest.raises(ValueError):
+        Config(CONFIG_FILE, {'infection.recoveryDurationTo': 32768})
+
+
+@pytest.mark.parametrize('overrides', [
+    {'infection.infectionPropability': 1.5},
+    {'infection.recoveryDurationFrom': 50},
+    {'infection.contactModel': 'telepathy'},
+    {'world.xMax': -1}
+])
+def test_invalid_values(overrides):
+    with pytest.raises(ValueError):
+        Config(CONFIG_FILE, overrides)
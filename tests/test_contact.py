@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from WorldOfCitizens.contact import find_contacts
+
+
+def find_contacts_brute_force(sources_x, sources_y, targets_x, targets_y, contact_range, source_groups=None, target_groups=None):
+    """
+    Reference: every source against every target, ordered by source, then target
+    """
+    in_zone = (targets_x > sources_x[:, np.newaxis] - contact_range) & \
+        (targets_y > sources_y[:, np.newaxis] - contact_range) & \
+        (targets_x < sources_x[:, np.newaxis] + contact_range) & \
+        (targets_y < sources_y[:, np.newaxis] + contact_range)
+    if source_groups is not None:
+        in_zone &= source_groups[:, np.newaxis] == target_groups
+    sources, targets = np.nonzero(in_zone)
+    return sources, targets
+
+
+def _assert_same_contacts(sources, targets, contact_range, groups=(None, None)):
+    expected = find_contacts_brute_force(sources[0], sources[1], targets[0], targets[1], contact_range, *groups)
+    actual = find_contacts(sources[0], sources[1], targets[0], targets[1], contact_range, *groups)
+    np.testing.assert_array_equal(expected[0], actual[0])
+    np.testing.assert_array_equal(expected[1], actual[1])
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+@pytest.mark.parametrize('seed', range(20))
+def test_random_positions(dtype, seed):
+    rng = np.random.default_rng(seed)
+    contact_range = rng.uniform(0.005, 0.1)
+    # Negative and out of world coordinates included
+    sources = rng.uniform(-0.5, 1.5, size=(2, rng.integers(1, 200))).astype(dtype)
+    targets = rng.uniform(-0.5, 1.5, size=(2, rng.integers(1, 2000))).astype(dtype)
+    _assert_same_contacts(sources, targets, contact_range)
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+@pytest.mark.parametrize('seed', range(10))
+def test_groups(dtype, seed):
+    rng = np.random.default_rng(seed)
+    sources = rng.uniform(0, 1, size=(2, 300)).astype(dtype)
+    targets = rng.uniform(0, 1, size=(2, 1000)).astype(dtype)
+    groups = (rng.integers(0, 4, size=300), rng.integers(0, 4, size=1000))
+    _assert_same_contacts(sources, targets, 0.05, groups)
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_zone_edges(dtype):
+    # Targets exactly on and next to the edge of the zone, and crowded into a single cell
+    contact_range = 0.02
+    offsets = np.array([-0.02, -0.0199999, 0, 0.0199999, 0.02, 0.0400001])
+    targets_x, targets_y = np.meshgrid(0.5 + offsets, 0.5 + offsets)
+    sources = np.array([[0.5, 0.51], [0.5, 0.49]], dtype=dtype)
+    targets = np.stack([targets_x.ravel(), targets_y.ravel()]).astype(dtype)
+    _assert_same_contacts(sources, targets, contact_range)
+    crowded = np.full((2, 500), 0.3, dtype=dtype)
+    _assert_same_contacts(crowded[:, :50], crowded, contact_range)
+
+
+def test_empty():
+    empty = np.empty((2, 0))
+    positions = np.zeros((2, 3))
+    _assert_same_contacts(empty, positions, 0.02)
+    _assert_same_contacts(positions, empty, 0.02)
@@ -0,0 +1,137 @@
+import os
+import numpy as np
+import pytest
+
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.simulation import Simulation
+from WorldOfCitizens.domain import DomainSimulation, TileGrid, _halo_sources
+from WorldOfCitizens.population import X, Y, STATE, INFECTED_SINCE, RECOVERY_DURATION, STATE_HEALTHY, STATE_SICK, STATE_DEAD
+from WorldOfCitizens.stat_tracker import SUSCEPTIBLE
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'woc-config.ini')
+# Everybody wanders the whole world, so tile borders are crossed all the time
+WANDERING = {
+    'simulation.populationSize': 1000,
+    'infection.infectionPropability': 0.1,
+    'event:start.destination': 0,
+    'event:patientZero.tick': 0,
+    'event:patientZero.action': 'seed',
+    'event:patientZero.count': 10
+}
+
+
+def _config(**overrides):
+    options = dict(WANDERING)
+    options.update(overrides)
+    return Config(CONFIG_FILE, options)
+
+
+def test_tile_of():
+    grid = TileGrid((0, 1), (0, 2), 2, 4)
+    assert len(grid) == 8
+    assert grid.tile_size == (0.5, 0.5)
+    x = np.array([0.1, 0.6, 0.1, 0.9, 0.5, -3.0, 7.0, 0.2])
+    y = np.array([0.1, 0.1, 0.6, 1.9, 1.0, -3.0, 7.0, 2.0])
+    np.testing.assert_array_equal(grid.tile_of(x, y), [0, 1, 2, 7, 5, 0, 7, 6])
+
+
+def test_tile_bounds_cover_the_plane():
+    grid = TileGrid((0, 1), (0, 1), 3, 2)
+    rng = np.random.default_rng(1)
+    x, y = rng.uniform(-1, 2, size=(2, 1000))
+    tiles = grid.tile_of(x, y)
+    for tile in range(len(grid)):
+        lower_x, upper_x, lower_y, upper_y = grid.bounds(tile)
+        inside = (x >= lower_x) & (x < upper_x) & (y >= lower_y) & (y < upper_y)
+        np.testing.assert_array_equal(inside, tiles == tile)
+    assert grid.bounds(0)[0] == -np.inf and grid.bounds(5)[1] == np.inf
+
+
+def test_halo_sources():
+    grid = TileGrid((0, 1), (0, 1), 2, 2)
+    # Near the center (all other tiles), near the vertical border, inside a tile, outside the world
+    sick = np.array([4, 7, 9, 12])
+    x = np.array([0.49, 0.51, 0.2, 1.5])
+    y = np.array([0.49, 0.2, 0.2, 0.9])
+    citizens, tiles = _halo_sources(grid, sick, grid.tile_of(x, y), x, y, 0.02)
+    assert sorted(zip(citizens.tolist(), tiles.tolist())) == [(4, 1), (4, 2), (4, 3), (7, 0)]
+
+
+def test_halo_sources_of_migrants():
+    grid = TileGrid((0, 1), (0, 1), 2, 2)
+    # A citizen still owned by tile 0 after moving into tile 1 is a source for tile 1 as well
+    citizens, tiles = _halo_sources(grid, np.array([3]), np.array([0], dtype=np.int32), np.array([0.7]), np.array([0.2]), 0.02)
+    assert sorted(zip(citizens.tolist(), tiles.tolist())) == [(3, 1)]
+
+
+def test_halo_infects_across_borders():
+    config = _config(**{'simulation.populationSize': 4, 'simulation.initAvgSpeed': 0, 'infection.infectionPropability': 1.0})
+    with DomainSimulation(config, tiles=(2, 2), seed=1) as simulation:
+        population = simulation.population
+        # Sick citizen in tile 0 within infectionRange of a healthy one in tile 1, the others far away
+        population[:, X] = [0.495, 0.505, 0.2, 0.8]
+        population[:, Y] = [0.3, 0.3, 0.8, 0.8]
+        population[:, STATE] = [STATE_SICK, STATE_HEALTHY, STATE_HEALTHY, STATE_HEALTHY]
+        population[0, INFECTED_SINCE] = 0
+        population[0, RECOVERY_DURATION] = 30
+        simulation.owner[:] = simulation._grid.tile_of(population[:, X], population[:, Y])
+        simulation.reschedule()
+        simulation.do_step()
+        np.testing.assert_array_equal(simulation.owner, [0, 1, 2, 3])
+        np.testing.assert_array_equal(population[:, STATE], [STATE_SICK, STATE_SICK, STATE_HEALTHY, STATE_HEALTHY])
+
+
+def test_migration():
+    with DomainSimulation(_config(), tiles=(3, 2), seed=4) as simulation:
+        initial = simulation.owner.copy()
+        for _ in range(20):
+            simulation.do_step()
+            population = simulation.population
+            alive = population[:, STATE] != STATE_DEAD
+            # Owners follow the citizens into the tile they moved into
+            np.testing.assert_array_equal(
+                simulation.owner[alive],
+                simulation._grid.tile_of(population[:, X], population[:, Y])[alive]
+            )
+        assert np.count_nonzero(simulation.owner != initial) > 0
+
+
+def test_reproducible():
+    histories = []
+    for _ in range(2):
+        with DomainSimulation(_config(), tiles=(2, 2), seed=5) as simulation:
+            histories.append(simulation.run(30).history.copy())
+    np.testing.assert_array_equal(histories[0], histories[1])
+
+
+def test_tiles_smaller_than_infection_range():
+    with pytest.raises(ValueError):
+        DomainSimulation(_config(**{'infection.infectionRange': 0.3}), tiles=(4, 4))
+
+
+def test_same_statistics_as_simulation():
+    config = _config()
+    n_ticks = 60
+    replicates = 12
+    single = np.array([Simulation(config, seed=seed).run(n_ticks).history[:, SUSCEPTIBLE] for seed in range(replicates)])
+    tiled = []
+    for seed in range(replicates):
+        with DomainSimulation(config, tiles=(2, 2), seed=100 + seed) as simulation:
+            tiled.append(simulation.run(n_ticks).history[:, SUSCEPTIBLE].copy())
+    tiled = np.array(tiled)
+
+    # Mean susceptible over the run and infected at the end, within 4 standard errors
+    for statistic in (lambda curves: curves.mean(axis=1), lambda curves: config.popuplation_size - curves[:, -1]):
+        a = statistic(single)
+        b = statistic(tiled)
+        error = np.sqrt(a.var(ddof=1) / replicates + b.var(ddof=1) / replicates)
+        assert abs(a.mean() - b.mean()) < 4 * error
+    assert np.all(tiled[:, -1] < 0.5 * config.popuplation_size)
+
+
+def test_both_contact_models():
+    pytest.importorskip('scipy')
+    config = _config(**{'infection.contactModel': 'both', 'network.destinationContacts': 0})
+    with DomainSimulation(config, tiles=(2, 2), seed=6) as simulation:
+        history = simulation.run(20).history
+    assert history[-1, SUSCEPTIBLE] < history[0, SUSCEPTIBLE]
@@ -0,0 +1,32 @@
+import numpy as np
+
+from WorldOfCitizens.instrumentation import Instrumentation
+
+
+def test_traced_memory_peak_per_tick():
+    instrumentation = Instrumentation(trace_memory_ticks=(0, 4))
+    for frame in range(4):
+        instrumentation.begin_tick(frame)
+        if frame == 1:
+            np.ones(50 * 2 ** 20, dtype=np.uint8).sum()
+        instrumentation.end_tick()
+
+    peaks = [record['traced_memory_peak'] for record in instrumentation.timeline]
+    assert peaks[1] > 50 * 2 ** 20
+    assert peaks[2] < 2 ** 20 and peaks[3] < 2 ** 20
+    assert instrumentation.memory_snapshot is not None
+
+
+def test_stages_add_up():
+    instrumentation = Instrumentation()
+    instrumentation.begin_tick(0)
+    for _ in range(3):
+        with instrumentation.stage('movement'):
+            pass
+    instrumentation.count('contacts', 2)
+    instrumentation.count('contacts', 3)
+    instrumentation.end_tick()
+
+    record = instrumentation.timeline[0]
+    assert record['contacts'] == 5
+    assert 0 <= record['movement'] <= record['tick']
@@ -0,0 +1,59 @@
+import os
+import warnings
+import numpy as np
+import pytest
+
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.simulation import Simulation
+from WorldOfCitizens.contact import find_contacts
+from WorldOfCitizens.population import X, Y, STATE, STATE_SICK
+
+pytest.importorskip('scipy')
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'woc-config.ini')
+
+
+@pytest.mark.parametrize('contact_model', ['network', 'both'])
+def test_one_generation_per_tick(contact_model):
+    config = Config(CONFIG_FILE, {
+        'simulation.populationSize': 3000,
+        'infection.contactModel': contact_model,
+        'infection.infectionPropability': 0.9,
+        'network.destinationContacts': 0,
+        'event:patientZero.tick': 0,
+        'event:patientZero.action': 'seed',
+        'event:patientZero.count': 1
+    })
+    simulation = Simulation(config, seed=3)
+    seed = np.flatnonzero(simulation.population[..., STATE] == STATE_SICK)
+    simulation.do_step()
+
+    # Only the patient zero infects in the first tick, not the citizens it infected
+    population = simulation.population
+    contacts = set(simulation.network.matrix[seed].indices)
+    if contact_model == 'both':
+        _, targets = find_contacts(population[seed, X], population[seed, Y], population[..., X], population[..., Y], config.infection_range)
+        contacts |= set(targets)
+    sick = set(np.flatnonzero(population[..., STATE] == STATE_SICK))
+    assert len(sick) > 1
+    assert sick <= contacts | set(seed)
+
+
+def test_certain_infection():
+    config = Config(CONFIG_FILE, {
+        'simulation.populationSize': 500,
+        'infection.contactModel': 'network',
+        'infection.infectionPropability': 1.0,
+        'event:patientZero.tick': 0,
+        'event:patientZero.action': 'seed',
+        'event:patientZero.count': 1
+    })
+    simulation = Simulation(config, seed=3)
+    seed = np.flatnonzero(simulation.population[..., STATE] == STATE_SICK)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        simulation.do_step()
+    # All household and workplace contacts of the patient zero
+    contacts = simulation.network.matrix[seed].indices
+    assert len(contacts) > 0
+    assert np.all(simulation.population[contacts, STATE] == STATE_SICK)
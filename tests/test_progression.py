@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import pytest
+
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.population import initialize_population, STATE, RECOVERY_DURATION, STATE_SICK, STATE_IMMUNE, STATE_DEAD
+from WorldOfCitizens.infection import infect, infect_citizens, recover_or_die
+from WorldOfCitizens.progression import DiseaseCalendar
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'woc-config.ini')
+
+
+def _recover_or_die_countdown(config, population, rng):
+    """
+    Reference: the former per-tick countdown of RECOVERY_DURATION of all sick citizens
+    """
+    state = population[..., STATE]
+    sick = state == STATE_SICK
+    population[..., RECOVERY_DURATION][sick] -= 1
+    done = sick & (population[..., RECOVERY_DURATION] <= 0)
+    dies = rng.random(size=np.count_nonzero(done)) <= config.mortality_chance
+    state[done] = np.where(dies, STATE_DEAD, STATE_IMMUNE)
+    return population
+
+
+@pytest.mark.parametrize('replicates', [None, 3])
+def test_calendar_matches_countdown(replicates):
+    # Short durations down to 0 ticks, a static world so both runs meet the same contacts
+    config = Config(CONFIG_FILE, {
+        'simulation.populationSize': 500,
+        'infection.infectionRange': 0.05,
+        'infection.infectionPropability': 0.2,
+        'infection.recoveryDurationFrom': 0,
+        'infection.recoveryDurationTo': 8
+    })
+    population = initialize_population(config, np.random.default_rng(1), replicates)
+    reference = population.copy()
+    rng = np.random.default_rng(2)
+    reference_rng = np.random.default_rng(2)
+    calendar = DiseaseCalendar()
+    seeds = np.arange(0, population[..., STATE].size, 100)
+    infect_citizens(config, population, seeds, 0, rng, calendar)
+    infect_citizens(config, reference, seeds, 0, reference_rng)
+
+    resolved = 0
+    for frame in range(60):
+        infect(config, population, frame, rng, calendar=calendar)
+        recover_or_die(config, population, frame, rng, calendar=calendar)
+        infect(config, reference, frame, reference_rng)
+        _recover_or_die_countdown(config, reference, reference_rng)
+        # Same outcomes in the same ticks
+        np.testing.assert_array_equal(population[..., STATE], reference[..., STATE])
+        resolved = np.count_nonzero(population[..., STATE] >= STATE_IMMUNE)
+
+    assert resolved > 20
+    assert np.count_nonzero(population[..., STATE] == STATE_DEAD) > 0
+    assert rng.bit_generator.state == reference_rng.bit_generator.state
+
+
+def test_outcome_at_end_of_duration():
+    config = Config(CONFIG_FILE, {'simulation.populationSize': 4, 'infection.mortalityChance': 0})
+    population = initialize_population(config, np.random.default_rng(1))
+    calendar = DiseaseCalendar()
+    infect_citizens(config, population, np.array([1]), 10, np.random.default_rng(3), calendar)
+    duration = int(population[1, RECOVERY_DURATION])
+    rng = np.random.default_rng(4)
+    for frame in range(10, 10 + duration):
+        assert population[1, STATE] == STATE_SICK
+        recover_or_die(config, population, frame, rng, calendar=calendar)
+    assert population[1, STATE] == STATE_IMMUNE
+    assert len(calendar) == 0
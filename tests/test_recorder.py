@@ -0,0 +1,88 @@
+import os
+import numpy as np
+import pytest
+
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.simulation import Simulation
+from WorldOfCitizens.batch import BatchSimulation
+from WorldOfCitizens.population import X, Y, STATE, DESTINATION
+from WorldOfCitizens.recorder import TrajectoryRecorder, TrajectoryReader
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'woc-config.ini')
+CONFIG = Config(CONFIG_FILE, {
+    'simulation.populationSize': 200,
+    'event:split.tick': 20,
+    'event:patientZero.tick': 0,
+    'event:patientZero.action': 'seed',
+    'event:patientZero.count': 5
+})
+
+
+def _record(simulation, path, n_ticks, **options):
+    """
+    Record n_ticks of simulation to path, returns the recorded snapshots by frame
+    """
+    recorder = TrajectoryRecorder(path, **options)
+    expected = {}
+
+    def capture(simulation):
+        if simulation.frame % options.get('every', 1) == 0:
+            expected[simulation.frame] = {key: simulation.population[..., column].copy()
+                                          for key, column in (('x', X), ('y', Y), ('state', STATE), ('destination', DESTINATION))}
+
+    simulation.add_observer(recorder)
+    simulation.add_observer(capture)
+    simulation.run(n_ticks)
+    recorder.close()
+    return expected
+
+
+def _assert_snapshot(snapshot, expected):
+    np.testing.assert_array_equal(snapshot['state'], expected['state'])
+    np.testing.assert_array_equal(snapshot['destination'], expected['destination'])
+    for key in ('x', 'y'):
+        values = expected[key]
+        # Half a quantization step over the range of the tick
+        step = (values.max() - values.min()) / np.iinfo(np.uint16).max
+        np.testing.assert_allclose(snapshot[key], values, rtol=0, atol=step / 2 + 1e-6)
+
+
+@pytest.mark.parametrize('options', [
+    {'chunk_ticks': 4, 'every': 3},
+    {'chunk_ticks': 100, 'every': 2, 'chunk_bytes': 5 * 2 * 2 * 200},
+    {'chunk_ticks': 1}
+])
+def test_round_trip(tmp_path, options):
+    expected = _record(Simulation(CONFIG, seed=12), str(tmp_path), 40, **options)
+    reader = TrajectoryReader(str(tmp_path))
+    assert reader.shape == (200,)
+    np.testing.assert_array_equal(reader.frames, sorted(expected))
+
+    # Every frame on its own, in reverse to seek backwards over chunks
+    for frame in sorted(expected, reverse=True):
+        snapshot = reader.read(frame)
+        assert snapshot['frame'] == frame
+        _assert_snapshot(snapshot, expected[frame])
+
+    # Incremental replay
+    frames = []
+    for snapshot in reader:
+        _assert_snapshot(snapshot, expected[snapshot['frame']])
+        frames.append(snapshot['frame'])
+    assert frames == sorted(expected)
+
+
+def test_batched_round_trip(tmp_path):
+    expected = _record(BatchSimulation(CONFIG, 3, seed=12), str(tmp_path), 12, chunk_ticks=5)
+    reader = TrajectoryReader(str(tmp_path))
+    assert reader.shape == (3, 200)
+    for snapshot in reader:
+        _assert_snapshot(snapshot, expected[snapshot['frame']])
+
+
+def test_frame_not_recorded(tmp_path):
+    _record(Simulation(CONFIG, seed=12), str(tmp_path), 10, chunk_ticks=4, every=2)
+    reader = TrajectoryReader(str(tmp_path))
+    for frame in (-1, 3, 10):
+        with pytest.raises(KeyError):
+            reader.read(frame)
@@ -0,0 +1,42 @@
+import os
+import pytest
+
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.simulation import Simulation
+
+renderer = pytest.importorskip('WorldOfCitizens.renderer')
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'woc-config.ini')
+CONFIG = Config(CONFIG_FILE, {'simulation.populationSize': 50})
+
+
+class _FailingWriter(object):
+    def write(self, image, frame):
+        raise OSError('disk full')
+
+    def close(self):
+        pass
+
+
+def test_render_png(tmp_path):
+    simulation = Simulation(CONFIG, seed=1)
+    worker = renderer.RenderWorker(CONFIG, str(tmp_path), every=2, ticks=6)
+    simulation.add_observer(worker)
+    simulation.run(6)
+    worker.close()
+    assert sorted(os.listdir(str(tmp_path))) == ['frame_{:06d}.png'.format(frame) for frame in (0, 2, 4)]
+
+
+def test_failing_worker_raises(monkeypatch, tmp_path):
+    monkeypatch.setattr(renderer, 'open_writer', lambda output, fps=25: _FailingWriter())
+    simulation = Simulation(CONFIG, seed=1)
+    simulation.add_observer(renderer.RenderWorker(CONFIG, str(tmp_path), queue_size=2))
+    # The worker stopped at the first frame, the full queue must not block the simulation
+    with pytest.raises(OSError):
+        simulation.run(20)
+
+
+def test_missing_ffmpeg(monkeypatch, tmp_path):
+    monkeypatch.setitem(renderer.matplotlib.rcParams, 'animation.ffmpeg_path', str(tmp_path / 'no-ffmpeg'))
+    with pytest.raises(FileNotFoundError):
+        renderer.RenderWorker(CONFIG, str(tmp_path / 'out.mp4'))
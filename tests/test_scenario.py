@@ -0,0 +1,115 @@
+import os
+import numpy as np
+import pytest
+
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.simulation import Simulation
+from WorldOfCitizens.batch import BatchSimulation
+from WorldOfCitizens.population import STATE, SPEED, DESTINATION, DESTINATION_ARRIVED, INFECTED_SINCE, STATE_SICK
+from WorldOfCitizens.scenario import EVENT_PREFIX
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'woc-config.ini')
+SIMULATIONS = {
+    'simulation': (Simulation, ()),
+    'batch': (BatchSimulation, (2,))
+}
+
+
+def _without_events(config: Config) -> Config:
+    return Config(overrides={key: value for key, value in config.to_dict().items() if not key.startswith(EVENT_PREFIX)})
+
+
+class _NoEvents(object):
+    def _apply_events(self):
+        pass
+
+
+class _Hardcoded(object):
+    """
+    Reference: the events hardcoded in Simulation before the scenario timeline
+    """
+
+    def _apply_events(self):
+        if self._frame == 0:
+            self._population[..., DESTINATION] = 1
+        if self._frame == 60:
+            update = self._rng.random(size=self._population.shape[:-1])
+            self._population[..., DESTINATION][update < 0.5] = 2
+            self._population[..., DESTINATION_ARRIVED][update < 0.5] = 0
+            self._population[..., DESTINATION][update >= 0.5] = 3
+            self._population[..., DESTINATION_ARRIVED][update > 0.5] = 0
+
+
+def _simulation(kind: str, config: Config, events=None):
+    """
+    Simulation of kind, with _apply_events of the mixin events
+    """
+    cls, arguments = SIMULATIONS[kind]
+    if events is not None:
+        cls = type(events.__name__ + cls.__name__, (events, cls), {})
+    return cls(config, *arguments, seed=8)
+
+
+def _small(config: Config) -> Config:
+    return config.override({'simulation.populationSize': 300})
+
+
+def _assert_same_run(simulation, reference, n_ticks):
+    for run in (simulation, reference):
+        run.population[..., STATE][..., :5] = STATE_SICK
+        run.reschedule()
+        run.run(n_ticks)
+    np.testing.assert_array_equal(simulation.stat_tracker.history, reference.stat_tracker.history)
+    for column, reference_column in zip(simulation.population.columns, reference.population.columns):
+        np.testing.assert_array_equal(column, reference_column)
+
+
+@pytest.mark.parametrize('kind', sorted(SIMULATIONS))
+def test_default_scenario_reproduces_hardcoded_events(kind):
+    config = _small(Config(CONFIG_FILE))
+    _assert_same_run(_simulation(kind, config), _simulation(kind, _without_events(config), _Hardcoded), 100)
+
+
+@pytest.mark.parametrize('kind', sorted(SIMULATIONS))
+def test_empty_scenario(kind):
+    config = _without_events(_small(Config(CONFIG_FILE)))
+    assert len(Simulation(config).scenario) == 0
+    _assert_same_run(_simulation(kind, config), _simulation(kind, config, _NoEvents), 100)
+
+
+def test_events_take_effect_at_their_tick():
+    config = _without_events(_small(Config(CONFIG_FILE))).override({
+        'event:lockdown.tick': 30,
+        'event:lockdown.action': 'speed',
+        'event:lockdown.limit': 0.01,
+        'event:lockdown.citizens': '0-99',
+        'event:reopen.tick': 50,
+        'event:reopen.action': 'speed',
+        'event:reopen.limit': 'none',
+        'event:patientZero.tick': 20,
+        'event:patientZero.action': 'seed',
+        'event:patientZero.count': 3,
+        'event:home.tick': 40,
+        'event:home.action': 'send',
+        'event:home.destination': 2,
+        'event:home.citizens': '200-'
+    })
+    simulation = Simulation(config, seed=9)
+    speeds = {}
+    sick = {}
+    destinations = {}
+    simulation.add_observer(lambda s: speeds.__setitem__(s.frame, np.abs(s.population[:100, SPEED]).max()))
+    simulation.add_observer(lambda s: sick.__setitem__(s.frame, np.count_nonzero(s.population[..., STATE] == STATE_SICK)))
+    simulation.add_observer(lambda s: destinations.__setitem__(s.frame, s.population[200:, DESTINATION].copy()))
+    simulation.run(60)
+
+    assert speeds[29] > 0.01
+    assert all(speeds[frame] <= 0.01 for frame in range(30, 50))
+    assert speeds[59] > 0.01
+
+    assert sick[19] == 0
+    assert sick[20] >= 3
+    assert np.count_nonzero(simulation.population[..., INFECTED_SINCE][simulation.population[..., STATE] != 0] == 20) >= 3
+
+    assert np.any(destinations[39] != 2)
+    assert np.all(destinations[40] == 2)
@@ -0,0 +1,110 @@
+import os
+import numpy as np
+import pytest
+
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.population import Population, STATE, STATE_HEALTHY, STATE_SICK, STATE_IMMUNE, STATE_DEAD
+from WorldOfCitizens.stat_tracker import StatTracker
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'woc-config.ini')
+CONFIG = Config(CONFIG_FILE)
+
+
+def _population(sick: int, shape=(10,)) -> Population:
+    """
+    Population of shape citizens with the first sick citizens of every replicate sick
+    """
+    population = Population.zeros(shape)
+    population[..., STATE] = STATE_HEALTHY
+    population[..., STATE][..., :sick] = STATE_SICK
+    return population
+
+
+def _record(stat_tracker: StatTracker, operations):
+    """
+    Apply (sick, ticks) operations: update with ticks == 1, else extend
+    """
+    for sick, ticks in operations:
+        if ticks == 1:
+            stat_tracker.update(CONFIG, _population(sick))
+        else:
+            stat_tracker.extend(CONFIG, _population(sick), ticks)
+    return stat_tracker
+
+
+def test_counts():
+    population = Population.zeros((2, 6))
+    population[..., STATE] = [[STATE_HEALTHY, STATE_SICK, STATE_SICK, STATE_IMMUNE, STATE_DEAD, STATE_HEALTHY],
+                              [STATE_SICK] * 6]
+    stat_tracker = StatTracker()
+    stat_tracker.update(CONFIG, population)
+    stat_tracker.update(CONFIG, population)
+    np.testing.assert_array_equal(stat_tracker.history[0], [[2, 2, 1, 1, 0], [0, 6, 0, 0, 0]])
+    assert stat_tracker.ticks == 2
+
+
+def test_ring_buffer_order():
+    stat_tracker = _record(StatTracker(max_history=3), [(sick, 1) for sick in range(10)])
+    np.testing.assert_array_equal(stat_tracker.infectious, [7, 8, 9])
+    np.testing.assert_array_equal(stat_tracker.new_infections, [1, 1, 1])
+    assert stat_tracker.ticks == 10
+    assert stat_tracker.first_tick == 7
+    assert stat_tracker.peak_infectious == 9
+    assert stat_tracker.time_to_peak == 9
+
+
+def test_max_history_one():
+    stat_tracker = StatTracker(max_history=1)
+    for sick in range(5):
+        stat_tracker.update(CONFIG, _population(sick))
+        np.testing.assert_array_equal(stat_tracker.history, [[10 - sick, sick, 0, 0, 1 if sick > 0 else 0]])
+    stat_tracker.extend(CONFIG, _population(2), 4)
+    np.testing.assert_array_equal(stat_tracker.history, [[8, 2, 0, 0, 0]])
+    assert stat_tracker.first_tick == 8
+
+
+@pytest.mark.parametrize('max_history', [1, 2, 3, 5, 8])
+def test_extend_across_the_wrap(max_history, tmp_path):
+    operations = [(1, 1), (2, 3), (3, 1), (3, 7), (4, 1), (5, 2), (6, 1), (6, 1), (7, 12), (8, 1)]
+    unbounded = _record(StatTracker(), operations)
+    stream = str(tmp_path / 'stats.csv')
+    bounded = _record(StatTracker(max_history=max_history, stream=stream, flush_every=4), operations)
+    bounded.close()
+
+    assert bounded.ticks == unbounded.ticks == sum(ticks for _, ticks in operations)
+    np.testing.assert_array_equal(bounded.history, unbounded.history[-max_history:])
+    assert bounded.first_tick == unbounded.ticks - max_history
+    # The stream receives every record
+    records = StatTracker.read_stream(stream)
+    np.testing.assert_array_equal(records['tick'], np.arange(unbounded.ticks))
+    np.testing.assert_array_equal(records['infectious'], unbounded.infectious)
+    np.testing.assert_array_equal(records['new_infections'], unbounded.new_infections)
+
+
+@pytest.mark.parametrize('max_history', [0, -1])
+def test_reject_max_history(max_history):
+    with pytest.raises(ValueError):
+        StatTracker(max_history=max_history)
+
+
+def test_r_t():
+    empty = StatTracker()
+    assert empty.r_t().shape == (0,)
+    assert empty.r_t().dtype == np.float64
+
+    stat_tracker = StatTracker()
+    stat_tracker.update(CONFIG, _population(0))
+    stat_tracker.update(CONFIG, _population(2))
+    r_t = stat_tracker.r_t(window=7)
+    assert np.isnan(r_t[0])
+    assert r_t[1] == pytest.approx(2 / 2 * sum(CONFIG.recovery_duration) / 2)
+
+
+def test_checkpoint_restore():
+    operations = [(sick, 1) for sick in (1, 3, 2, 5, 4)]
+    stat_tracker = _record(StatTracker(max_history=3), operations[:3])
+    restored = StatTracker.restore(stat_tracker.history, stat_tracker.checkpoint())
+    _record(restored, operations[3:])
+    reference = _record(StatTracker(max_history=3), operations)
+    np.testing.assert_array_equal(restored.history, reference.history)
+    assert restored.checkpoint() == reference.checkpoint()
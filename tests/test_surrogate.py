@@ -0,0 +1,25 @@
+import os
+import warnings
+import numpy as np
+import pytest
+
+from WorldOfCitizens.config import Config
+from WorldOfCitizens.surrogate import MeanFieldModel
+from WorldOfCitizens.stat_tracker import SUSCEPTIBLE, INFECTIOUS, RECOVERED, FATALITIES
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'woc-config.ini')
+
+
+@pytest.mark.parametrize('probability', [0.03, 1.0])
+@pytest.mark.parametrize('initial_infectious', [0, 1])
+def test_integrate(probability, initial_infectious):
+    config = Config(CONFIG_FILE, {'infection.infectionPropability': probability})
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        history = MeanFieldModel(config).integrate(300, initial_infectious)
+
+    compartments = history[..., [SUSCEPTIBLE, INFECTIOUS, RECOVERED, FATALITIES]]
+    assert np.all(np.isfinite(compartments))
+    np.testing.assert_allclose(compartments.sum(axis=-1), config.popuplation_size)
+    if initial_infectious == 0:
+        assert np.all(history[..., SUSCEPTIBLE] == config.popuplation_size)